@@ -0,0 +1,94 @@
+import zlib
+from store import COMPARTMENTS, LOCKDOWN
+
+
+class ActiveSet:
+    """The places whose daily update can change anything.
+
+    `sick` holds the places with anyone exposed, infected, detected or
+    treated; with no contagious neighbour either, all of a place's draws
+    are certain zeros and consume no randomness. `angry` holds the places
+    in lockdown, with anger left or in backlash, whose anger moves every
+    day. Every other place is unchanged by the day, so updating only these
+    sets gives exactly the same trajectory as updating every place.
+
+    The sets are kept up to date by whoever updates the places, through
+    `refresh`. `is_current` compares the store against the signature
+    taken by `mark`: writes made elsewhere, such as patient zero or a
+    restore, change the day or totals and need a `scan`, and control
+    measures changed by the player only need the lockdowns rescanned.
+    """
+
+    def __init__(self, sick, angry):
+        self.sick = sick
+        self.angry = angry
+        self.signature = None
+
+    @classmethod
+    def scan(cls, store):
+        """Find both sets with one pass over every place."""
+        sick = {
+            node
+            for node, counts in enumerate(
+                zip(store.exposed, store.infected, store.detected, store.treated)
+            )
+            if any(counts)
+        }
+        active = cls(sick, set())
+        active.scan_angry(store)
+        return active
+
+    def scan_angry(self, store):
+        self.angry = {
+            node
+            for node, (anger, in_backlash, measures) in enumerate(
+                zip(store.anger, store.in_backlash, store.measures)
+            )
+            if anger or in_backlash or measures & LOCKDOWN
+        }
+
+    def copy(self):
+        active = ActiveSet(set(self.sick), set(self.angry))
+        active.signature = self.signature
+        return active
+
+    def refresh(self, store, nodes):
+        """Re-check the membership of `nodes` after they were updated."""
+        sick, angry = self.sick, self.angry
+        exposed, infected, detected, treated = (
+            store.exposed,
+            store.infected,
+            store.detected,
+            store.treated,
+        )
+        anger, in_backlash, measures = store.anger, store.in_backlash, store.measures
+        for node in nodes:
+            if exposed[node] or infected[node] or detected[node] or treated[node]:
+                sick.add(node)
+            else:
+                sick.discard(node)
+            if anger[node] or in_backlash[node] or measures[node] & LOCKDOWN:
+                angry.add(node)
+            else:
+                angry.discard(node)
+
+    @staticmethod
+    def _signature(day, store):
+        return (
+            day,
+            tuple(store.totals[name] for name in COMPARTMENTS),
+            zlib.crc32(store.measures),
+        )
+
+    def mark(self, day, store):
+        self.signature = self._signature(day, store)
+
+    def sync(self, day, store):
+        """Bring the sets up to date with `store`; False if a full `scan` is needed."""
+        signature = self._signature(day, store)
+        if self.signature is None or signature[:2] != self.signature[:2]:
+            return False
+        if signature[2] != self.signature[2]:
+            self.scan_angry(store)
+            self.signature = signature
+        return True
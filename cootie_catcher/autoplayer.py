@@ -0,0 +1,250 @@
+import math
+import time
+from dataclasses import dataclass, replace
+import numpy as np
+from ensemble import Ensemble
+from store import MEASURE_BITS
+
+# rollouts take the expected value of draws expecting at least this many kids
+# to move, see sampling.mean_field, so a few rollouts rank candidates well;
+# rarer draws, such as infected travellers, stay random
+DEFAULT_MEAN_FIELD_THRESHOLD = 10
+
+# most replicates stepped at once, to bound memory
+MAX_BATCH = 1 << 16
+
+
+@dataclass
+class Suggestion:
+    """The best allocation of control measures an `Autoplayer` found.
+
+    `measures` is the bitmask of measures per place, as in
+    `PlaceStore.measures`. Costs are the expected kids homeschooled by the
+    end of the horizon, counting those still sick by their chance of dying,
+    under the suggestion and under the measures already in place.
+    """
+
+    measures: np.ndarray
+    cost: float
+    current_cost: float
+    evaluated: int
+    seconds: float
+
+    @property
+    def rate(self):
+        """Candidates evaluated per second."""
+        return self.evaluated / max(self.seconds, 1e-9)
+
+    def apply(self, pandemic):
+        """Set exactly the suggested measures on `pandemic`."""
+        for node, measures in enumerate(self.measures.tolist()):
+            for action, bit in MEASURE_BITS.items():
+                pandemic.set_measure(node, action, bool(measures & bit))
+
+
+class Autoplayer:
+    """Searches for the allocation of control measures that does least harm.
+
+    An allocation sets any of the measures at any place not in backlash,
+    with at most `action_budget` measures in all. Search is a beam search
+    from the measures in place: each round, every allocation in the beam
+    of `beam` is changed by adding, removing or moving one measure, with
+    at most `moves` changes each. New candidates are screened with
+    `screen_rollouts` rollouts each, and the best `keep` fraction of them
+    is evaluated again with `rollouts` rollouts. The beam is the best
+    `beam` evaluated so far, and the search stops after `rounds` rounds,
+    once the beam is unchanged or, with a `time_budget` in seconds, once
+    another round as long as the last would overrun it.
+
+    Rollouts of every candidate are stepped together as one `Ensemble`
+    for `horizon` days, long enough for lockdowns to anger parents into
+    backlash. The cost of a rollout is the kids homeschooled at its end,
+    plus those still sick times their chance of dying before they recover,
+    mortality / (mortality + recovery).
+    """
+
+    def __init__(
+        self,
+        horizon=7,
+        rollouts=4,
+        screen_rollouts=1,
+        keep=0.25,
+        beam=4,
+        rounds=8,
+        moves=256,
+        mean_field_threshold=DEFAULT_MEAN_FIELD_THRESHOLD,
+        time_budget=None,
+        seed=None,
+    ):
+        self.horizon = horizon
+        self.rollouts = rollouts
+        self.screen_rollouts = screen_rollouts
+        self.keep = keep
+        self.beam = beam
+        self.rounds = rounds
+        self.moves = moves
+        self.mean_field_threshold = mean_field_threshold
+        self.time_budget = time_budget
+        self.rng = np.random.default_rng(seed)
+
+    def evaluate(self, pandemic, candidates, rollouts=None):
+        """Mean cost of each row of (candidate, place) measure bitmasks.
+
+        Leaves the game and its random state untouched.
+        """
+        candidates = np.asarray(candidates, dtype=np.uint8)
+        rollouts = rollouts or self.rollouts
+        params = pandemic.params
+        if self.mean_field_threshold:
+            params = replace(params, mean_field_threshold=self.mean_field_threshold)
+        sick_weight = params.mortality_rate / (
+            params.mortality_rate + params.recovery_rate
+        )
+
+        costs = []
+        chunk = max(MAX_BATCH // rollouts, 1)
+        for start in range(0, len(candidates), chunk):
+            batch = candidates[start : start + chunk]
+            ensemble = Ensemble.from_pandemic(
+                pandemic, len(batch) * rollouts, seed=self.rng, params=params
+            )
+            ensemble.state.measures[:] = np.repeat(batch, rollouts, axis=0)
+            ensemble.run(self.horizon)
+            state = ensemble.state
+            sick = state.exposed + state.infected + state.detected + state.treated
+            cost = (state.dead + sick_weight * sick).sum(axis=1)
+            costs.append(cost.reshape(len(batch), rollouts).mean(axis=1))
+        return np.concatenate(costs) if costs else np.zeros(0)
+
+    def suggest(self, pandemic):
+        """Search for the best allocation for the coming days, see the class."""
+        start = time.perf_counter()
+        store = pandemic.store
+        actions = len(MEASURE_BITS)
+        allowed = np.repeat(
+            np.frombuffer(store.in_backlash, dtype=np.int8) == 0, actions
+        )
+        current = _to_bits(np.frombuffer(store.measures, dtype=np.uint8), actions)
+        budget = pandemic.action_budget
+
+        current_cost = float(self.evaluate(pandemic, _to_measures(current[None]))[0])
+        costs = {current.tobytes(): current_cost}
+        evaluated = 1
+        beam = [current]
+        round_start = time.perf_counter()
+        for _ in range(self.rounds):
+            # stop if another round as long as the last would overrun
+            now = time.perf_counter()
+            round_seconds, round_start = now - round_start, now
+            if (
+                self.time_budget is not None
+                and now - start + round_seconds > self.time_budget
+            ):
+                break
+            candidates = self._neighbours(beam, allowed, budget)
+            candidates = candidates[
+                [bits.tobytes() not in costs for bits in candidates]
+            ]
+            if len(candidates) == 0:
+                break
+
+            # a cheap screen, then a closer look at the best
+            screen = self.evaluate(
+                pandemic, _to_measures(candidates), self.screen_rollouts
+            )
+            best = np.argsort(screen, kind="stable")[
+                : max(self.beam, math.ceil(len(candidates) * self.keep))
+            ]
+            full = self.evaluate(pandemic, _to_measures(candidates[best]))
+            evaluated += len(candidates)
+            for bits, cost in zip(candidates[best], full.tolist()):
+                costs[bits.tobytes()] = cost
+
+            ranked = sorted(costs, key=costs.get)[: self.beam]
+            if ranked == [bits.tobytes() for bits in beam]:
+                break
+            beam = [np.frombuffer(key, dtype=bool) for key in ranked]
+
+        best = min(costs, key=costs.get)
+        return Suggestion(
+            measures=_to_measures(np.frombuffer(best, dtype=bool)[None])[0],
+            cost=costs[best],
+            current_cost=current_cost,
+            evaluated=evaluated,
+            seconds=time.perf_counter() - start,
+        )
+
+    def _neighbours(self, beam, allowed, budget):
+        # allocations one added, removed or moved measure away from the beam
+        neighbours = []
+        for bits in beam:
+            on = np.flatnonzero(bits)
+            off = np.flatnonzero(~bits & allowed)
+            flips = [(idx, None) for idx in on.tolist()]
+            if on.size < budget:
+                flips += [(idx, None) for idx in off.tolist()]
+            if on.size and off.size:
+                pairs = np.stack(np.meshgrid(on, off), axis=-1).reshape(-1, 2)
+                flips += [tuple(pair) for pair in pairs.tolist()]
+            if len(flips) > self.moves:
+                chosen = self.rng.choice(len(flips), self.moves, replace=False)
+                flips = [flips[idx] for idx in chosen.tolist()]
+
+            moved = np.repeat(bits[None], len(flips), axis=0)
+            for row, (first, second) in enumerate(flips):
+                moved[row, first] ^= True
+                if second is not None:
+                    moved[row, second] ^= True
+            neighbours.append(moved)
+        return np.unique(np.concatenate(neighbours), axis=0)
+
+
+def _to_bits(measures, actions):
+    # (place,) bitmasks to flat (place * action) flags
+    bits = np.unpackbits(measures[:, None], axis=1, count=actions, bitorder="little")
+    return bits.astype(bool).ravel()
+
+
+def _to_measures(bits):
+    # (candidate, place * action) flags to (candidate, place) bitmasks
+    actions = len(MEASURE_BITS)
+    flags = bits.reshape(len(bits), -1, actions)
+    return np.packbits(flags, axis=-1, bitorder="little")[..., 0]
+
+
+def play(pandemic, autoplayer=None, days=None):
+    """Play a game headless, applying a suggestion before every day.
+
+    Stops when the game is won or lost, or after `days` days; returns the
+    suggestions made.
+    """
+    autoplayer = autoplayer if autoplayer is not None else Autoplayer()
+    p = pandemic.params
+    suggestions = []
+    while days is None or len(suggestions) < days:
+        if (
+            pandemic.days_since_last_infection >= p.win_threshold
+            or pandemic.pct_dead >= p.lose_threshold
+        ):
+            break
+        suggestion = autoplayer.suggest(pandemic)
+        suggestion.apply(pandemic)
+        pandemic.update()
+        suggestions.append(suggestion)
+    return suggestions
+
+
+if __name__ == "__main__":
+    from sim import Pandemic
+
+    for seed in range(5):
+        pandemic = Pandemic(seed=seed)
+        suggestions = play(pandemic, Autoplayer(seed=seed), days=200)
+        evaluated = sum(suggestion.evaluated for suggestion in suggestions)
+        seconds = sum(suggestion.seconds for suggestion in suggestions)
+        won = pandemic.days_since_last_infection >= pandemic.params.win_threshold
+        print(
+            f"seed {seed}: {'won' if won else 'lost'} on day {pandemic.day}"
+            + f" with {pandemic.get_totals().dead} homeschooled,"
+            + f" {evaluated / seconds:.0f} candidates/s"
+        )
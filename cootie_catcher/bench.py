@@ -0,0 +1,342 @@
+import argparse
+import functools
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from params import Params
+from sampling import Sampler
+from sim import Pandemic
+
+# place counts benchmarked, with the default 150 kids per place
+SCALES = (20, 1_000, 10_000, 100_000, 1_000_000)
+DEFAULT_SCALES = SCALES[:4]
+BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json"
+)
+
+# a new time this much above the baseline is a regression
+DEFAULT_THRESHOLD = 0.25
+
+
+def scaled_params(place_count):
+    return Params.from_consts(
+        place_count=place_count, total_population=150 * place_count
+    )
+
+
+def outbreak(place_count, engine="python"):
+    """A game with 1% of every place infected, so every place has work to do.
+
+    Games are built once per size and engine and forked for each use.
+    """
+    return _outbreak(place_count, engine).fork()
+
+
+@functools.lru_cache(maxsize=2)
+def _outbreak(place_count, engine):
+    pandemic = Pandemic(engine=engine, seed=0, params=scaled_params(place_count))
+    for place in pandemic.cities:
+        place.infected = place.susceptible // 100
+        place.susceptible -= place.infected
+    return pandemic
+
+
+# each benchmark takes a place count and returns (function, units, reset):
+# one call of function() is timed as `units` units of work, after an
+# untimed call of reset(), if any
+
+
+def bench_binomial(place_count):
+    rng = Sampler(0)
+    n = 150
+    draws = 1000
+
+    def run():
+        for _ in range(draws):
+            rng.binomial(n, 0.1)
+
+    return run, draws, None
+
+
+def bench_update_place(place_count):
+    pandemic = outbreak(place_count)
+    start = pandemic.fork()
+    nodes = range(min(place_count, 1000))
+
+    def run():
+        for node in nodes:
+            pandemic.update_place(node)
+
+    return run, len(nodes), lambda: pandemic.restore(start)
+
+
+def bench_update(place_count, engine="python"):
+    # every call steps the same day, so the outbreak doesn't run its course
+    pandemic = outbreak(place_count, engine=engine)
+    start = pandemic.fork()
+
+    return pandemic.update, 1, lambda: pandemic.restore(start)
+
+
+def bench_update_numpy(place_count):
+    return bench_update(place_count, engine="numpy")
+
+
+def bench_get_totals(place_count):
+    pandemic = outbreak(place_count)
+    calls = 1000
+
+    def run():
+        for _ in range(calls):
+            pandemic.get_totals()
+
+    return run, calls, None
+
+
+def bench_action_count(place_count):
+    pandemic = outbreak(place_count)
+    pandemic.randomize_actions("lockdown", place_count // 4)
+    calls = 1000
+
+    def run():
+        for _ in range(calls):
+            pandemic.action_count
+
+    return run, calls, None
+
+
+def bench_randomize_actions(place_count):
+    pandemic = outbreak(place_count)
+
+    def run():
+        pandemic.randomize_actions("lockdown", max(1, place_count // 10))
+
+    return run, 1, None
+
+
+def bench_init(place_count):
+    params = scaled_params(place_count)
+
+    def run():
+        Pandemic(seed=0, params=params)
+
+    return run, 1, None
+
+
+BENCHMARKS = {
+    "binomial": bench_binomial,
+    "update_place": bench_update_place,
+    "update": bench_update,
+    "update[numpy]": bench_update_numpy,
+    "get_totals": bench_get_totals,
+    "action_count": bench_action_count,
+    "randomize_actions": bench_randomize_actions,
+    "init": bench_init,
+}
+
+
+def measure(benchmark, place_count, repeat=3, min_time=0.2):
+    """Best time per unit of `benchmark`, peak memory of one call and calibration.
+
+    Calls are repeated until `min_time` has passed, `repeat` times over,
+    and the best mean is kept. The peak is the most memory traced by
+    tracemalloc during one more call, made separately as tracing slows
+    everything down. Each repeat is preceded by a `calibrate`, whose best
+    time is kept to compare results from machines, or moments, that run at
+    different speeds.
+    """
+    run, units, reset = benchmark(place_count)
+    reset = reset or (lambda: None)
+    reset()
+    run()
+    best = float("inf")
+    calibration = float("inf")
+    for _ in range(repeat):
+        calibration = min(calibration, calibrate())
+        calls = 0
+        elapsed = 0.0
+        # as timeit does, keep collections out of the timings
+        gc.collect()
+        gc.disable()
+        while elapsed < min_time:
+            reset()
+            start = time.perf_counter()
+            run()
+            elapsed += time.perf_counter() - start
+            calls += 1
+        gc.enable()
+        best = min(best, elapsed / calls / units)
+
+    reset()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    run()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak, "calibration": calibration}
+
+
+def calibrate(repeat=3):
+    """Best time of a fixed pure-Python workload, to gauge the machine's speed."""
+
+    def run():
+        total = 0
+        for idx in range(100_000):
+            total += idx % 7
+        return total
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_all(names, scales, repeat=3, min_time=0.2, log=None):
+    results = []
+    for place_count in scales:
+        for name in names:
+            result = {"name": name, "places": place_count}
+            result.update(
+                measure(BENCHMARKS[name], place_count, repeat=repeat, min_time=min_time)
+            )
+            results.append(result)
+            if log:
+                log(_format(result))
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "date": time.strftime("%Y-%m-%d"),
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """(name, places, ratio) of results slower than the baseline by `threshold`.
+
+    Times are scaled by the calibrations taken next to them, so a machine
+    that is busier or slower as a whole doesn't show up as a regression.
+    """
+    old = {(r["name"], r["places"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        key = (result["name"], result["places"])
+        if key in old:
+            speed = result["calibration"] / old[key]["calibration"]
+            ratio = result["seconds"] / (old[key]["seconds"] * speed)
+            if ratio > 1 + threshold:
+                regressions.append(key + (ratio,))
+    return regressions
+
+
+def _format(result):
+    seconds = result["seconds"]
+    if seconds >= 1:
+        timing = f"{seconds:8.2f} s "
+    elif seconds >= 1e-3:
+        timing = f"{seconds * 1e3:8.2f} ms"
+    else:
+        timing = f"{seconds * 1e6:8.2f} us"
+    return (
+        f"{result['name']:>18} {result['places']:>9} places {timing}"
+        + f" peak {result['peak_bytes'] / 2**20:9.2f} MiB"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the simulation and compare with a stored baseline. "
+        + "update is per simulated day, update_place and binomial per call."
+    )
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SCALES,
+        metavar="PLACES",
+        help=f"place counts to run, up to {SCALES[-1]}",
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="seconds per repeat"
+    )
+    parser.add_argument("--output", "-o", help="write results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="fraction slower than the baseline that fails",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_all(
+        args.only,
+        args.scales,
+        repeat=args.repeat,
+        min_time=args.min_time,
+        log=print,
+    )
+    regressions = []
+    if args.save_baseline:
+        _write(args.baseline, results)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = check(results, baseline, args)
+        for name, places, ratio in regressions:
+            print(f"REGRESSION {name} at {places} places: {ratio:.2f}x the baseline")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline")
+
+    if args.output:
+        _write(args.output, results)
+    if regressions:
+        sys.exit(1)
+
+
+def check(results, baseline, args):
+    regressions = compare(results, baseline, threshold=args.threshold)
+    if not regressions:
+        return regressions
+
+    # timings are noisy, so only report what is slow a second time
+    print("Re-measuring slow benchmarks")
+    retry = {(name, places) for name, places, _ in regressions}
+    for result in results["results"]:
+        if (result["name"], result["places"]) in retry:
+            again = measure(
+                BENCHMARKS[result["name"]],
+                result["places"],
+                repeat=args.repeat,
+                min_time=args.min_time,
+            )
+            if again["seconds"] / again["calibration"] < (
+                result["seconds"] / result["calibration"]
+            ):
+                result.update(again)
+    return compare(results, baseline, threshold=args.threshold)
+
+
+def _write(path, results):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import sys
+import time
+from array import array
+from dataclasses import fields
+from parallel import PartitionedSimulation
+from params import Params
+from profiling import PROFILER
+from sim import Pandemic
+from store import COMPARTMENTS
+
+BINARY_MAGIC = b"COOTIE1\n"
+
+
+class CsvWriter:
+    """One row per place per day: run, day, node and the compartments."""
+
+    def __init__(self, file):
+        self.file = file
+        file.write(",".join(("run", "day", "node") + COMPARTMENTS) + "\n")
+
+    def write(self, run, day, store):
+        prefix = f"{run},{day},"
+        self.file.write(
+            "".join(
+                [
+                    f"{prefix}{node},{s},{e},{i},{d},{t},{dead}\n"
+                    for node, (s, e, i, d, t, dead) in enumerate(
+                        zip(*(getattr(store, name) for name in COMPARTMENTS))
+                    )
+                ]
+            )
+        )
+
+
+class BinaryWriter:
+    """Columnar binary output, one block per day.
+
+    The file starts with BINARY_MAGIC and a JSON header line giving the
+    columns and the place count. Each block is the run and day as int32,
+    then one int32 array per compartment with a value per place. All
+    values are little-endian; see `read_binary`.
+    """
+
+    def __init__(self, file, place_count):
+        self.file = file
+        self.place_count = place_count
+        header = {"columns": list(COMPARTMENTS), "places": place_count, "dtype": "<i4"}
+        file.write(BINARY_MAGIC + json.dumps(header).encode() + b"\n")
+
+    def write(self, run, day, store):
+        write = self.file.write
+        write(_little_endian(array("i", (run, day))))
+        for name in COMPARTMENTS:
+            write(_little_endian(getattr(store, name)))
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def read_binary(file):
+    """Yield (run, day, {compartment: array}) for each block of a binary file."""
+    if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not a cootie_catcher binary output file")
+    header = json.loads(file.readline())
+    place_count = header["places"]
+    column_bytes = place_count * 4
+    while True:
+        block = file.read(8 + column_bytes * len(header["columns"]))
+        if len(block) < 8:
+            return
+        values = array("i", block)
+        if sys.byteorder == "big":
+            values.byteswap()
+        yield values[0], values[1], {
+            name: values[2 + idx * place_count : 2 + (idx + 1) * place_count]
+            for idx, name in enumerate(header["columns"])
+        }
+
+
+def parse_params(assignments):
+    """Turn ["name=value", ...] into `Params`, converting to the field types."""
+    types = {field.name: field.type for field in fields(Params)}
+    overrides = {}
+    for assignment in assignments:
+        name, sep, value = assignment.partition("=")
+        if not sep:
+            raise ValueError(f"Expected name=value, got {assignment!r}")
+        if name not in types:
+            raise ValueError(f"Unknown parameter {name!r}")
+        overrides[name] = types[name](value)
+    return Params.from_consts(**overrides)
+
+
+def run(
+    writer,
+    runs=1,
+    days=1000,
+    seed=None,
+    params=None,
+    engine="python",
+    all_days=False,
+    parts=1,
+    counter_rng=False,
+):
+    """Simulate `runs` games and write every day's state to `writer`.
+
+    Games stop when they are won or lost unless `all_days` is set. With
+    `parts` > 1 each game's network is split across that many worker
+    processes, see parallel.py; this needs the numpy engine and counter
+    streams, which are turned on, and gives the same games as a single
+    process with `counter_rng`. Returns the number of simulated days.
+    """
+    params = params if params is not None else Params.from_consts()
+    if parts > 1 and engine != "numpy":
+        raise ValueError("Partitioned runs need the numpy engine")
+    counter_rng = counter_rng or parts > 1
+    simulated = 0
+    for run_idx in range(runs):
+        run_seed = None if seed is None else f"{seed}-{run_idx}"
+        pandemic = Pandemic(
+            engine=engine, seed=run_seed, params=params, counter_rng=counter_rng
+        )
+        if parts > 1:
+            partitioned = PartitionedSimulation(pandemic, parts)
+            update = partitioned.advance
+        else:
+            partitioned = None
+            update = pandemic.update
+        try:
+            writer.write(run_idx, pandemic.day, pandemic.store)
+            while pandemic.day < days:
+                update()
+                simulated += 1
+                writer.write(run_idx, pandemic.day, pandemic.store)
+                if not all_days and (
+                    pandemic.days_since_last_infection >= params.win_threshold
+                    or pandemic.pct_dead >= params.lose_threshold
+                ):
+                    break
+        finally:
+            if partitioned is not None:
+                partitioned.close()
+    return simulated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run Cootie Catcher games without the GUI and stream "
+        + "every place's compartments for every day."
+    )
+    parser.add_argument("--runs", type=int, default=1, help="number of games")
+    parser.add_argument("--days", type=int, default=1000, help="days per game")
+    parser.add_argument("--seed", help="base seed, game i uses '<seed>-<i>'")
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="override a model parameter, e.g. travel_rate=0.05",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=Pandemic.engines,
+        help="default python, or numpy with --parts",
+    )
+    parser.add_argument(
+        "--parts",
+        type=int,
+        default=1,
+        help="split each game's network across this many worker processes, "
+        + "implies --counter-rng",
+    )
+    parser.add_argument(
+        "--counter-rng",
+        action="store_true",
+        help="draw from counter streams, so games match across --parts",
+    )
+    parser.add_argument("--format", choices=("csv", "binary"), default="csv")
+    parser.add_argument(
+        "--output", "-o", default="-", help="output file, '-' for stdout"
+    )
+    parser.add_argument(
+        "--all-days",
+        action="store_true",
+        help="keep simulating after a game is won or lost",
+    )
+    parser.add_argument(
+        "--quiet", "-q", action="store_true", help="do not report throughput"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="TRACE",
+        help="time the phases of every day and write a Chrome trace here",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        params = parse_params(args.param)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.engine is None:
+        args.engine = "numpy" if args.parts > 1 else "python"
+    elif args.parts > 1 and args.engine != "numpy":
+        parser.error(f"--parts {args.parts} needs --engine numpy")
+
+    binary = args.format == "binary"
+    if args.output == "-":
+        file = sys.stdout.buffer if binary else sys.stdout
+        close = False
+    else:
+        file = open(args.output, "wb" if binary else "w")
+        close = True
+
+    if args.profile:
+        PROFILER.enable()
+
+    try:
+        writer = BinaryWriter(file, params.place_count) if binary else CsvWriter(file)
+        start = time.perf_counter()
+        simulated = run(
+            writer,
+            runs=args.runs,
+            days=args.days,
+            seed=args.seed,
+            params=params,
+            engine=args.engine,
+            all_days=args.all_days,
+            parts=args.parts,
+            counter_rng=args.counter_rng,
+        )
+        elapsed = time.perf_counter() - start
+    except BrokenPipeError:
+        # the reader stopped early, as with `| head`
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        if close:
+            file.close()
+        else:
+            file.flush()
+
+    if not args.quiet:
+        print(
+            f"{simulated} days in {elapsed:.2f}s "
+            + f"({simulated / max(elapsed, 1e-9):.0f} days/s)",
+            file=sys.stderr,
+        )
+    if args.profile:
+        PROFILER.save_trace(args.profile)
+        if not args.quiet:
+            print(PROFILER.format_summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
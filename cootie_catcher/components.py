@@ -1,7 +1,9 @@
 import pyxel
 import consts as c
 import textwrap
+import threading
 import time
+from profiling import PROFILER
 
 
 class Hoverable:
@@ -72,21 +74,86 @@ class NextDayButton:
             text=self.next_button_text,
         )
 
-    def draw(self):
+    def draw(self, busy=False):
+        # same width as the button text, with a spinner while a day runs
+        if busy:
+            spinner = "|/-\\"[pyxel.frame_count // 4 % 4]
+            self.next_button.text = f"Working {spinner}"
+        else:
+            self.next_button.text = self.next_button_text
         self.next_button.draw()
 
-    def update(self, sim):
+    def update(self, stepper):
         if self.next_button.is_clicked():
-            sim.update()  # Update simulation only if next button is pressed
+            stepper.start()  # Update simulation only if next button is pressed
+
+
+class UndoButton:
+    text = "Undo Day"
+    x = (
+        NextDayButton.x
+        - len("Show Map") * c.CHARACTER_WIDTH
+        - len(text) * c.CHARACTER_WIDTH
+        - Button.text_padding * 4
+        - 10
+    )
+
+    def __init__(self):
+        self.undo_button = Button(x=self.x, y=c.BOTTOM_MENU_HEIGHT, text=self.text)
+
+    def draw(self, sim):
+        if sim.can_undo:
+            self.undo_button.draw()
+
+    def update(self, sim):
+        if sim.can_undo and self.undo_button.is_clicked():
+            sim.undo()
+
+
+class PreviewButton:
+    """Toggles a preview of tomorrow under the current control measures.
+
+    The preview is recomputed only when the day or the measures change.
+    """
+
+    text = "Preview: Off"
+    x = UndoButton.x - len(text) * c.CHARACTER_WIDTH - Button.text_padding * 2 - 5
+    rollouts = 100
+
+    def __init__(self):
+        self.preview_button = Button(x=self.x, y=c.BOTTOM_MENU_HEIGHT, text=self.text)
+        self.enabled = False
+        self.preview = None
+        self.key = None
+
+    def draw(self):
+        self.preview_button.text = "Preview: On" if self.enabled else "Preview: Off"
+        self.preview_button.draw()
+
+    def update(self, sim):
+        if self.preview_button.is_clicked():
+            self.enabled = not self.enabled
+
+        if not self.enabled:
+            self.preview = None
+            self.key = None
+            return
+
+        key = (sim.store, sim.generation, sim.store.measures.tobytes())
+        if key != self.key:
+            from preview import preview
+
+            self.key = key
+            self.preview = preview(sim, rollouts=self.rollouts)
 
 
 class ActionCheckbox(Clickable):
-    def __init__(self, x, y, size, place_name, action_name):
+    def __init__(self, x, y, size, node, action_name):
         self.x = x
         self.y = y
         self.width = size
         self.height = size
-        self.place_name = place_name
+        self.node = node
         self.action_name = action_name
 
     def draw(self, sim):
@@ -98,16 +165,16 @@ class ActionCheckbox(Clickable):
             pyxel.rect(self.x, self.y, self.width, self.height, c.DARK)
 
     def is_checked(self, sim):
-        return sim.cities[self.place_name].control_measures[self.action_name]
+        return sim.has_measure(self.node, self.action_name)
 
     def update(self, sim):
-        is_checkable = sim.action_budget - sim.action_count > 0
         if self.is_clicked():
+            is_checkable = sim.actions_left > 0
             if not self.is_checked(sim) and is_checkable:
-                sim.cities[self.place_name].control_measures[self.action_name] = True
+                sim.set_measure(self.node, self.action_name, True)
 
             elif self.is_checked(sim):
-                sim.cities[self.place_name].control_measures[self.action_name] = False
+                sim.set_measure(self.node, self.action_name, False)
 
 
 class Place(Hoverable):
@@ -124,13 +191,13 @@ class Place(Hoverable):
                 + c.BORDER,  # 6 is the number of columns before the action columns
                 y=self.y + 2,
                 size=5,
-                place_name=place.place_name,
+                node=place.node,
                 action_name=action,
             )
             for idx, action in enumerate(c.ACTIONS)
         }
 
-    def draw(self, sim):
+    def draw(self, sim, preview=None):
         fields = (
             self.place.place_name,
             self.place.susceptible + self.place.exposed + self.place.infected,
@@ -158,6 +225,14 @@ class Place(Hoverable):
             else:
                 stat_str = str(f)
 
+            # expected change by tomorrow for caught, treated and homeschooled
+            if preview is not None and idx in (3, 4, 5):
+                change = preview.expected_change(
+                    ("detected", "treated", "dead")[idx - 3], self.place.node
+                )
+                if round(change, 1):
+                    stat_str += f" ({change:+.1f})"
+
             pyxel.text(c.COL_WIDTH * idx + c.BORDER, self.y + 2, stat_str, color)
 
         for idx, action in enumerate(self.checkboxes):
@@ -180,7 +255,7 @@ class GameStats:
         pyxel.text(
             c.BORDER,
             c.SCREEN_HEIGHT - c.BORDER - 30,
-            f"Action count: {sim.action_count} (Remaining: {sim.action_budget - sim.action_count})",
+            f"Action count: {sim.action_count} (Remaining: {sim.actions_left})",
             c.DARK,
         )
         pyxel.text(c.BORDER, c.SCREEN_HEIGHT - c.BORDER - 20, f"Day: {sim.day}", c.DARK)
@@ -288,6 +363,10 @@ class InfoBox:
         )
 
     def draw(self):
+        with PROFILER.span("InfoBox.draw"):
+            self.draw_box()
+
+    def draw_box(self):
         self.is_shown = True
 
         # every 10 milliseconds, draw one more character
@@ -321,13 +400,10 @@ class RandomizeActionButton:
     def update(self, sim):
         if self.randomize_button.is_clicked():
             # get number of actions currently selected for action_name
-            selected_actions = [
-                city.control_measures[self.action_name] for city in sim.cities.values()
-            ]
-            num_selected = sum(selected_actions)
+            num_selected = sim.measure_count(self.action_name)
 
             # get number of actions left in budget
-            actions_left = sim.action_budget - sim.action_count
+            actions_left = sim.actions_left
 
             # randomize actions
             sim.randomize_actions(
@@ -345,8 +421,91 @@ class ClearActionButton:
 
     def update(self, sim):
         if self.clear_button.is_clicked():
-            for city in sim.cities.values():
-                city.control_measures[self.action_name] = False
+            sim.clear_measure(self.action_name)
+
+
+class SuggestButton:
+    """Sets the measures an `Autoplayer` finds best for the coming days.
+
+    The search runs on a fork of the game in a worker thread, as in
+    `DayStepper`, and its suggestion is dropped if the game has moved to
+    another day, or back, by the time it finishes. Where threads cannot
+    be started, as in Pyodide, it runs synchronously, and `time_budget`
+    bounds the stalled frame.
+    """
+
+    text = "Suggest"
+    # seconds of searching before the best allocation so far is taken
+    time_budget = 0.25
+
+    def __init__(self, x, y):
+        self.suggest_button = Button(x=x, y=y, text=self.text)
+        self.autoplayer = None
+        self.background = True
+        self._thread = None
+        self._generation = None
+        self._suggestion = None
+        self._error = None
+
+    @property
+    def busy(self):
+        return self._thread is not None
+
+    def draw(self):
+        # same width as the button text, with a spinner while searching
+        if self.busy:
+            spinner = "|/-\\"[pyxel.frame_count // 4 % 4]
+            self.suggest_button.text = f"Think {spinner}"
+        else:
+            self.suggest_button.text = self.text
+        self.suggest_button.draw()
+
+    def update(self, sim):
+        self.poll(sim)
+        if self.suggest_button.is_clicked() and not self.busy:
+            self.start(sim)
+
+    def start(self, sim):
+        if self.autoplayer is None:
+            from autoplayer import Autoplayer
+
+            self.autoplayer = Autoplayer(time_budget=self.time_budget)
+        fork = sim.fork()
+        self._generation = sim.generation
+        if self.background:
+            self._thread = threading.Thread(
+                target=self._suggest, args=(fork,), daemon=True
+            )
+            try:
+                self._thread.start()
+                return
+            except RuntimeError:
+                self._thread = None
+                self.background = False
+
+        self.autoplayer.suggest(fork).apply(sim)
+
+    def poll(self, sim):
+        """Apply a finished suggestion, returns True if the game changed."""
+        if self._thread is None or self._thread.is_alive():
+            return False
+
+        self._thread.join()
+        self._thread = None
+        suggestion, error = self._suggestion, self._error
+        self._suggestion = self._error = None
+        if error is not None:
+            raise error
+        if sim.generation != self._generation:
+            return False
+        suggestion.apply(sim)
+        return True
+
+    def _suggest(self, fork):
+        try:
+            self._suggestion = self.autoplayer.suggest(fork)
+        except BaseException as error:
+            self._error = error
 
 
 class SelectionButtons:
@@ -367,17 +526,150 @@ class SelectionButtons:
             )
             for idx, action in enumerate(c.ACTIONS)
         ]
+        self.suggest_button = SuggestButton(
+            x=c.COL_WIDTH * (7 + len(c.ACTIONS)),
+            y=c.ROW_HEIGHT * (c.PLACE_COUNT + 1) + c.BORDER,
+        )
+
+    @property
+    def buttons(self):
+        return self.randomize_buttons + self.clear_buttons + [self.suggest_button]
 
     def draw(self, game_state):
         if game_state.map_visible:
             return
 
-        for button in self.randomize_buttons + self.clear_buttons:
+        for button in self.buttons:
             button.draw()
 
     def update(self, game_state, sim):
         if game_state.map_visible:
             return
 
-        for button in self.randomize_buttons + self.clear_buttons:
+        for button in self.buttons:
             button.update(sim)
+
+
+class EpiCurve:
+    """Epidemic curves of the totals the player can see.
+
+    The line segments are rebuilt only when a day is recorded, drawing
+    them is the only per-frame work.
+    """
+
+    x = c.COL_WIDTH * 4 + c.BORDER
+    y = c.ROW_HEIGHT * (c.PLACE_COUNT + 1) + c.BORDER
+    width = c.COL_WIDTH * 3 - c.BORDER * 2
+    height = c.BOTTOM_MENU_HEIGHT - y - c.BORDER
+    series = (
+        ("detected", "Caught", c.ALERT_COLOR),
+        ("treated", "Treated", c.GREEN),
+        ("dead", "Homeschooled", c.DARK),
+    )
+
+    def __init__(self):
+        self.key = None
+        self.segments = []
+
+    def draw(self, sim):
+        history = sim.history
+        if history is None:
+            return
+        # undo rewinds the history, so its count alone can repeat
+        key = (history, sim.generation)
+        if key != self.key:
+            self.key = key
+            self.segments = self.build_segments(history)
+
+        pyxel.rect(self.x, self.y, self.width, self.height, c.LIGHT)
+        pyxel.rectb(self.x, self.y, self.width, self.height, c.DARK)
+        label_x = self.x + 2
+        for _, label, color in self.series:
+            pyxel.text(label_x, self.y + 2, label, color)
+            label_x += (len(label) + 1) * c.CHARACTER_WIDTH
+        for x1, y1, x2, y2, color in self.segments:
+            pyxel.line(x1, y1, x2, y2, color)
+
+    def build_segments(self, history):
+        if len(history) < 2:
+            return []
+
+        # at most one point per pixel column
+        step = -(-len(history) // (self.width - 4))
+        curves = [
+            (history.total(compartment)[::step], color)
+            for compartment, _, color in self.series
+        ]
+        peak = max(max(int(values.max()) for values, _ in curves), 1)
+
+        left = self.x + 2
+        bottom = self.y + self.height - 3
+        plot_height = self.height - c.CHARACTER_HEIGHT - 6
+        x_scale = (self.width - 4) / max(len(curves[0][0]) - 1, 1)
+        segments = []
+        for values, color in curves:
+            points = [
+                (left + idx * x_scale, bottom - value * plot_height / peak)
+                for idx, value in enumerate(values.tolist())
+            ]
+            segments.extend(
+                (x1, y1, x2, y2, color)
+                for (x1, y1), (x2, y2) in zip(points, points[1:])
+            )
+        return segments
+
+
+class ProfilerOverlay:
+    """Frame time and simulation step time, toggled with the P key.
+
+    Showing the overlay turns the profiler on, see profiling.py, and hiding
+    it turns it back off unless something else had turned it on.
+    """
+
+    key = pyxel.KEY_P
+    lines = 4
+    width = 24 * c.CHARACTER_WIDTH
+    height = lines * c.CHARACTER_HEIGHT + 4
+    x = c.SCREEN_WIDTH - width - c.BORDER
+    y = c.BORDER
+
+    def __init__(self):
+        self.visible = False
+        self.enabled_profiler = False
+        self.last_frame = None
+
+    def update(self):
+        if not pyxel.btnp(self.key):
+            return
+        self.visible = not self.visible
+        if self.visible and not PROFILER.enabled:
+            PROFILER.enable()
+            self.enabled_profiler = True
+        elif not self.visible and self.enabled_profiler:
+            PROFILER.disable()
+            self.enabled_profiler = False
+
+    def draw(self):
+        # time between the starts of consecutive draws
+        now = time.perf_counter()
+        frame = now - self.last_frame if self.last_frame is not None else None
+        self.last_frame = now
+        if not self.visible:
+            return
+
+        rows = (
+            ("frame", frame),
+            ("update", PROFILER.last("App.update")),
+            ("draw", PROFILER.last("App.draw")),
+            ("sim step", PROFILER.last("Pandemic.update")),
+        )
+        pyxel.rect(self.x, self.y, self.width, self.height, c.LIGHT)
+        pyxel.rectb(self.x, self.y, self.width, self.height, c.DARK)
+        for idx, (label, seconds) in enumerate(rows):
+            value = f"{seconds * 1e3:7.2f} ms" if seconds is not None else "      -"
+            pyxel.text(
+                self.x + 2,
+                self.y + 2 + idx * c.CHARACTER_HEIGHT,
+                f"{label:<9}{value}",
+                c.DARK,
+            )
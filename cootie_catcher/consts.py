@@ -13,6 +13,9 @@ RECOVERY_RATE = 1 / 7
 CONTACTS = 10
 MASS_TESTING_DETECTION_RATE = 1
 CONTACT_TRACING_CAPACITY = 50
+# draws expecting at least this many kids to move, or to stay, take their
+# expected value instead of a random sample, 0 keeps every draw random
+MEAN_FIELD_THRESHOLD = 0
 
 PLACE_NAMES = [
     "Little Sprouts Preschool",
@@ -0,0 +1,399 @@
+import numpy as np
+from profiling import PROFILER
+from store import (
+    COMPARTMENTS,
+    CONTACT_TRACING,
+    LOCKDOWN,
+    MASS_TESTING,
+    MEASURE_BITS,
+    RESTRICT_TRAVEL,
+)
+from streams import (
+    INFECTED_TRAVELLERS,
+    NEW_DEAD_FROM_DETECTED,
+    NEW_DEAD_FROM_INFECTED,
+    NEW_DEAD_FROM_TREATED,
+    NEW_DETECTED,
+    NEW_EXPOSED,
+    NEW_INFECTED,
+    NEW_SUSCEPTIBLE_FROM_DETECTED,
+    NEW_SUSCEPTIBLE_FROM_INFECTED,
+    NEW_SUSCEPTIBLE_FROM_TREATED,
+    NEW_TREATED,
+)
+
+
+class PlaceArrays:
+    """Per-place epidemic state held as one NumPy array per field."""
+
+    fields = COMPARTMENTS + ("anger", "in_backlash", "measures")
+
+    def __init__(self, shape):
+        for name in COMPARTMENTS:
+            setattr(self, name, np.zeros(shape, dtype=np.int64))
+        self.anger = np.zeros(shape, dtype=np.int64)
+        self.in_backlash = np.zeros(shape, dtype=bool)
+        self.measures = np.zeros(shape, dtype=np.uint8)
+
+    @classmethod
+    def view(cls, store):
+        """Return arrays sharing memory with the typed arrays of a `PlaceStore`."""
+        state = cls(0)
+        for name in cls.fields:
+            values = getattr(store, name)
+            dtype = bool if name == "in_backlash" else values.typecode
+            setattr(state, name, np.frombuffer(values, dtype=dtype))
+        return state
+
+    def take(self, rows):
+        """Return a copy of the state restricted to `rows` of the leading axis."""
+        subset = PlaceArrays(0)
+        for name in self.fields:
+            setattr(subset, name, getattr(self, name)[rows])
+        return subset
+
+    def put(self, rows, subset):
+        for name in self.fields:
+            getattr(self, name)[rows] = getattr(subset, name)
+
+    def alive(self):
+        return (
+            self.susceptible
+            + self.exposed
+            + self.infected
+            + self.detected
+            + self.treated
+        )
+
+    def population(self):
+        return self.alive() + self.dead
+
+
+class NeighbourSum:
+    """Sums per-place values over each place's neighbours in an `Adjacency`.
+
+    Works on arrays of shape (..., place_count), e.g. (replicates, places),
+    as one segmented reduction over the CSR neighbour index.
+    """
+
+    def __init__(self, adjacency):
+        self.adjacency = adjacency
+        offsets = np.frombuffer(adjacency.offsets, dtype=np.int64)
+        self.neighbours = np.frombuffer(adjacency.neighbours, dtype=np.int64)
+        # reduceat runs each segment up to the next start, so only places
+        # with neighbours start one, isolated places stay zero
+        self.connected = np.flatnonzero(np.diff(offsets))
+        self.starts = offsets[self.connected]
+        self.place_count = offsets.size - 1
+
+    def __call__(self, values):
+        sums = np.zeros(values.shape[:-1] + (self.place_count,), dtype=values.dtype)
+        if self.neighbours.size:
+            sums[..., self.connected] = np.add.reduceat(
+                values[..., self.neighbours], self.starts, axis=-1
+            )
+        return sums
+
+
+def draw(binomial, *transitions):
+    """Draw several independent (transition, n, p) draws with one `binomial` call.
+
+    The draws are stacked along a new second-to-last axis, so a (replicate,
+    place) state is drawn as (replicate, transition, place), and `binomial`
+    gets the tuple of transition ids for that axis.
+    """
+    shape = np.broadcast_shapes(*(np.shape(n) for _, n, _ in transitions))
+    ids = tuple(transition for transition, _, _ in transitions)
+    n = np.stack([np.broadcast_to(n, shape) for _, n, _ in transitions], axis=-2)
+    p = np.stack([np.broadcast_to(p, shape) for _, _, p in transitions], axis=-2)
+    samples = binomial(n, p, ids)
+    return [samples[..., idx, :] for idx in range(len(transitions))]
+
+
+def step(state, neighbour_sum, binomial, params):
+    """Advance every place in `state` by one day.
+
+    Applies the same transitions as `Pandemic.update_place`, with neighbour
+    contagion read from the start-of-day counts of all places.
+    `neighbour_sum(x)` sums x over each place's neighbours,
+    `binomial(n, p, transition)` draws element-wise binomial samples, with
+    `transition` a `streams` transition id or a tuple of ids along the
+    second-to-last axis, and `params` is a `Params`.
+    Independent transitions are drawn together in four stages. With
+    `params.mean_field_threshold` set, draws expecting many kids to move
+    take their expected counts, see `mean_field_binomial`.
+    """
+    p = params
+    if p.mean_field_threshold:
+        binomial = mean_field_binomial(binomial, p.mean_field_threshold)
+    # phase timings, see profiling.py
+    profile = PROFILER.enabled
+    if profile:
+        start = PROFILER.clock()
+    alive = state.alive()
+    population = alive + state.dead
+    active = alive > 0
+
+    # update backlash
+    lockdown = (state.measures & LOCKDOWN) != 0
+    state.anger += np.where(active & lockdown, 1, 0)
+    state.anger -= np.where(active & ~lockdown & (state.anger > 0), 1, 0)
+    state.in_backlash &= ~(active & (state.anger == 0))
+
+    backlash = active & (state.anger == p.anger_threshold)
+    state.measures[backlash] = 0
+    state.in_backlash |= backlash
+
+    measures = state.measures
+    restrict_travel = (measures & (RESTRICT_TRAVEL | LOCKDOWN)) != 0
+    lockdown = (measures & LOCKDOWN) != 0
+    contact_tracing = (measures & CONTACT_TRACING) != 0
+    mass_testing = (measures & MASS_TESTING) != 0
+    if profile:
+        start = PROFILER.lap("backlash", start)
+
+    # get infections in neighbours
+    neighbour_contagious = neighbour_sum(state.infected + state.exposed)
+    if profile:
+        start = PROFILER.lap("neighbours", start)
+
+    # calculate infected travellers as a proportion of infected in neighbours
+    travel_rate = np.where(restrict_travel, 0.0, p.travel_rate)
+    infected_travellers = binomial(
+        neighbour_contagious, travel_rate, INFECTED_TRAVELLERS
+    )
+
+    # calculate number of people spreading
+    total_spreading = state.infected + infected_travellers + state.exposed
+    total_spreading -= np.where(
+        contact_tracing, np.minimum(p.contact_tracing_capacity, total_spreading), 0
+    )
+
+    mixing = alive + infected_travellers
+    infection_risk_per_contact = np.divide(
+        p.infection_rate * total_spreading,
+        mixing,
+        out=np.zeros(mixing.shape),
+        where=mixing > 0,
+    )
+    contacts = np.where(lockdown, 0, p.contacts)
+    infection_risk = 1 - (1 - infection_risk_per_contact) ** contacts
+
+    detection_rate = np.where(
+        mass_testing, p.mass_testing_detection_rate, p.detection_rate
+    )
+    if profile:
+        start = PROFILER.lap("exposure", start)
+
+    # transitions that only depend on start-of-day counts
+    (
+        new_exposed,
+        new_infected,
+        new_detected,
+        treatment_draws,
+        new_dead_from_treated,
+    ) = draw(
+        binomial,
+        (NEW_EXPOSED, state.susceptible, infection_risk),
+        (NEW_INFECTED, state.exposed, p.incubation_rate),
+        (NEW_DETECTED, state.infected, detection_rate),
+        (NEW_TREATED, state.detected, p.treatment_rate),
+        (NEW_DEAD_FROM_TREATED, state.treated, p.mortality_rate * 0.1),
+    )
+    new_treated = np.minimum(treatment_draws, population * p.treatment_capacity).astype(
+        np.int64
+    )
+    if profile:
+        start = PROFILER.lap("start of day draws", start)
+
+    # deaths among those not detected, treated or recovered
+    new_dead_from_infected, new_dead_from_detected, new_susceptible_from_treated = draw(
+        binomial,
+        (NEW_DEAD_FROM_INFECTED, state.infected - new_detected, p.mortality_rate),
+        (NEW_DEAD_FROM_DETECTED, state.detected - new_treated, p.mortality_rate),
+        (
+            NEW_SUSCEPTIBLE_FROM_TREATED,
+            state.treated - new_dead_from_treated,
+            p.recovery_rate * 5,
+        ),
+    )
+    if profile:
+        start = PROFILER.lap("death draws", start)
+
+    # recoveries among the remainder
+    new_susceptible_from_infected, new_susceptible_from_detected = draw(
+        binomial,
+        (
+            NEW_SUSCEPTIBLE_FROM_INFECTED,
+            state.infected - new_detected - new_dead_from_infected,
+            p.recovery_rate,
+        ),
+        (
+            NEW_SUSCEPTIBLE_FROM_DETECTED,
+            state.detected - new_treated - new_dead_from_detected,
+            p.recovery_rate,
+        ),
+    )
+    if profile:
+        start = PROFILER.lap("recovery draws", start)
+
+    # update place data
+    state.susceptible += (
+        new_susceptible_from_infected
+        + new_susceptible_from_detected
+        + new_susceptible_from_treated
+        - new_exposed
+    )
+    state.exposed += new_exposed - new_infected
+    state.infected += (
+        new_infected
+        - new_detected
+        - new_dead_from_infected
+        - new_susceptible_from_infected
+    )
+    state.detected += (
+        new_detected
+        - new_treated
+        - new_dead_from_detected
+        - new_susceptible_from_detected
+    )
+    state.treated += new_treated - new_dead_from_treated - new_susceptible_from_treated
+    state.dead += (
+        new_dead_from_infected + new_dead_from_detected + new_dead_from_treated
+    )
+    if profile:
+        PROFILER.lap("apply", start)
+
+
+def mean_field_binomial(binomial, threshold):
+    """Array version of `sampling.mean_field`.
+
+    Elements with n * min(p, 1 - p) >= `threshold` take n * p rounded half
+    to even; only the others are passed on to `binomial`, with the large
+    ones zeroed so they cost no sampling.
+    """
+
+    def draw(n, p, transition):
+        p_ = np.clip(p, 0.0, 1.0)
+        large = n * np.minimum(p_, 1.0 - p_) >= threshold
+        samples = binomial(np.where(large, 0, n), p, transition)
+        expected = np.rint(n * p_).astype(np.int64)
+        return np.where(large, expected, samples)
+
+    return draw
+
+
+def stream_binomial(streams, day, places, key=None):
+    """`binomial(n, p, transition)` for `step` drawing from counter streams.
+
+    `places` holds the node of each place along the last axis; `day` and
+    `key` broadcast against the leading axes.
+    """
+
+    def binomial(n, p, transition):
+        if isinstance(transition, tuple):
+            transition = np.array(transition).reshape(-1, 1)
+        return streams.binomials(n, p, day, places, transition, key=key)
+
+    return binomial
+
+
+class NumpyEngine:
+    """Advances all places of a `Pandemic` in one vectorized step per day."""
+
+    def __init__(self, params, rng=None, streams=None):
+        self.params = params
+        self.neighbour_sum = None
+        self.store = None
+        self.state = None
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.streams = streams
+
+    def binomial(self, n, p, transition=None):
+        return self.rng.binomial(n, p)
+
+    def update(self, store, adjacency, day=None):
+        """Advance `store` by one day; `day` addresses the counter streams."""
+        if self.neighbour_sum is None or self.neighbour_sum.adjacency is not adjacency:
+            self.neighbour_sum = NeighbourSum(adjacency)
+        if self.state is None or self.store is not store:
+            self.store = store
+            self.state = PlaceArrays.view(store)
+
+        binomial = self.binomial
+        if self.streams is not None:
+            binomial = stream_binomial(self.streams, day, np.arange(len(store)))
+        step(self.state, self.neighbour_sum, binomial, self.params)
+        sync_totals(store, self.state)
+
+
+def sync_totals(store, state):
+    """Recount the running totals of `store` after `state` was stepped in bulk."""
+    # the population is unchanged, only the compartment totals move
+    for name in COMPARTMENTS:
+        store.totals[name] = int(getattr(state, name).sum(dtype=np.int64))
+
+    # backlash may have cleared control measures
+    for action, bit in MEASURE_BITS.items():
+        store.measure_counts[action] = int(np.count_nonzero(state.measures & bit))
+    store.measure_total = sum(store.measure_counts.values())
+
+
+if __name__ == "__main__":
+    from network import Adjacency, Network
+
+    # isolated places anywhere in the index, including after the last
+    # connected one, sum the same as Adjacency.neighbour_sum
+    network = Network()
+    network.add_nodes_from(range(6))
+    network.add_edges_from([(1, 2), (2, 3), (1, 3)])
+    adjacency = Adjacency(network)
+    values = np.array([1, 10, 100, 1000, 10000, 100000])
+    expected = adjacency.neighbour_sum(values.tolist())
+    sums = NeighbourSum(adjacency)(values)
+    print(f"neighbour sums {sums.tolist()}, expected {expected}")
+    assert sums.tolist() == expected
+    replicated = NeighbourSum(adjacency)(np.stack([values, values * 2]))
+    assert replicated.tolist() == [expected, [2 * x for x in expected]]
+
+    # with counter streams the numpy engine, the python engine and its full
+    # scan draw the same trajectories; sequentially, the two python scans do
+    from params import Params
+    from sim import Pandemic
+
+    def play_together(games, days):
+        for day in range(days):
+            for game in games:
+                # a lockdown, later moved, exercises anger and backlash
+                if day == 5:
+                    game.set_measure(1, "lockdown", True)
+                if day == 15:
+                    game.set_measure(1, "lockdown", False)
+                    game.set_measure(2, "lockdown", True)
+                game.update()
+            first = games[0]
+            for game in games[1:]:
+                for name in first.store.fields:
+                    assert getattr(game.store, name) == getattr(first.store, name)
+                assert game.days_since_last_infection == (
+                    first.days_since_last_infection
+                )
+
+    days = 60
+    for place_count in (20, 300):
+        params = Params.from_consts(
+            place_count=place_count, total_population=150 * place_count
+        )
+        for seed in range(3):
+            for counter_rng in (True, False):
+                games = [
+                    Pandemic(seed=seed, params=params, counter_rng=counter_rng)
+                    for _ in range(2)
+                ]
+                if counter_rng:
+                    games.append(
+                        Pandemic("numpy", seed=seed, params=params, counter_rng=True)
+                    )
+                games[1].skip_quiescent = False
+                play_together(games, days)
+            print(f"{place_count} places, seed {seed}: engines match for {days} days")
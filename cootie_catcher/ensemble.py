@@ -0,0 +1,181 @@
+import numpy as np
+from engine import NeighbourSum, PlaceArrays, step, stream_binomial
+from network import Adjacency, barabasi_albert_network
+from params import Params
+from profiling import PROFILER
+from store import MEASURE_BITS
+from streams import CounterStreams, derive_key
+
+
+class Ensemble:
+    """Independent realizations of the same network advanced in lockstep.
+
+    State is held as (replicate, place) arrays. Replicates carry their own
+    control-measure bitmask, so they can be compared under different
+    policies. Replicates that have been won or lost are masked out of later
+    steps but kept in place.
+
+    Each replicate draws from its own counter streams, keyed by the seed
+    and its index, so its trajectory does not depend on the others; every
+    stage of a day is still drawn for all replicates in one vectorized
+    call. With `shared_rng` all replicates draw from a single NumPy
+    generator instead, which is faster but makes a replicate's draws
+    depend on which others are still running.
+    """
+
+    def __init__(
+        self,
+        replicates,
+        network=None,
+        seed=None,
+        params=None,
+        shared_rng=False,
+    ):
+        self.params = params if params is not None else Params.from_consts()
+        p = self.params
+        seeds = np.random.SeedSequence(seed)
+        if network is None:
+            network_seed = int(seeds.generate_state(1)[0])
+            network = barabasi_albert_network(p.place_count, 2, seed=network_seed)
+        self.adjacency = Adjacency(network)
+        self.replicates = replicates
+        self.place_count = network.number_of_nodes()
+        self.neighbour_sum = NeighbourSum(self.adjacency)
+        self.generator = np.random.default_rng(seeds.spawn(1)[0])
+
+        # replicate r draws from the counter streams under its own key
+        self.keys = None
+        if not shared_rng:
+            # unseeded ensembles take the fresh entropy of their SeedSequence
+            stream_seed = seed if seed is not None else seeds.entropy
+            keys = np.array([derive_key(stream_seed, r) for r in range(replicates)])
+            self.streams = CounterStreams(stream_seed)
+            self.keys = keys.T.astype(np.uint64)
+
+        shape = (replicates, self.place_count)
+        self.state = PlaceArrays(shape)
+
+        # population = world population * node degree / (edge count * 2)
+        degree = np.array([network.degree[node] for node in range(self.place_count)])
+        place_pop = p.total_population * degree / (network.number_of_edges() * 2)
+        self.state.susceptible[:] = place_pop.astype(np.int64)
+
+        # create patient(s) zero, replicate r's from the r-th draw
+        patient_zero = self.generator.integers(self.place_count, size=replicates)
+        self.state.infected[np.arange(replicates), patient_zero] = 5
+
+        self.day = np.zeros(replicates, dtype=np.int64)
+        self.days_since_last_infection = np.zeros(replicates, dtype=np.int64)
+        self.peak_infected = np.zeros(replicates, dtype=np.int64)
+        self.won = np.zeros(replicates, dtype=bool)
+        self.lost = np.zeros(replicates, dtype=bool)
+
+    @classmethod
+    def from_pandemic(cls, pandemic, replicates, seed=None, params=None):
+        """Replicates that all start from the current state of a `Pandemic`.
+
+        The neighbour index is shared with the game, and the game's random
+        state is not touched. All replicates draw from one generator seeded
+        by `seed`, as with `shared_rng`, which is faster for short rollouts.
+        `params` default to the game's.
+        """
+        ensemble = cls.__new__(cls)
+        ensemble.params = params if params is not None else pandemic.params
+        ensemble.adjacency = pandemic.adjacency
+        ensemble.replicates = replicates
+        ensemble.place_count = len(pandemic.store)
+        ensemble.neighbour_sum = NeighbourSum(ensemble.adjacency)
+        ensemble.generator = np.random.default_rng(seed)
+        ensemble.keys = None
+
+        ensemble.state = PlaceArrays((replicates, ensemble.place_count))
+        start = PlaceArrays.view(pandemic.store)
+        for name in PlaceArrays.fields:
+            getattr(ensemble.state, name)[:] = getattr(start, name)
+
+        def repeat(value):
+            return np.full(replicates, value, dtype=np.int64)
+
+        ensemble.day = repeat(pandemic.day)
+        ensemble.days_since_last_infection = repeat(pandemic.days_since_last_infection)
+        totals = pandemic.store.totals
+        ensemble.peak_infected = repeat(totals["infected"] + totals["detected"])
+        ensemble.won = np.zeros(replicates, dtype=bool)
+        ensemble.lost = np.zeros(replicates, dtype=bool)
+        return ensemble
+
+    @property
+    def finished(self):
+        return self.won | self.lost
+
+    @property
+    def pct_dead(self):
+        alive = self.state.alive().sum(axis=1)
+        population = self.state.population().sum(axis=1)
+        return ((1 - alive / population) * 100).astype(np.int64)
+
+    def set_measure(self, action_name, mask):
+        """Turn an action on wherever `mask` is set, broadcast to (replicate, place)."""
+        bit = MEASURE_BITS[action_name]
+        mask = np.broadcast_to(mask, self.state.measures.shape)
+        self.state.measures[mask] |= bit
+        self.state.measures[~mask] &= ~np.uint8(bit)
+
+    def update(self):
+        with PROFILER.span("Ensemble.update"):
+            self._update()
+        PROFILER.flush("Ensemble.update")
+
+    def _update(self):
+        p = self.params
+        rows = np.flatnonzero(~self.finished)
+        if rows.size == 0:
+            return
+
+        self.day[rows] += 1
+
+        # update days since last infection
+        state = self.state
+        infections = (state.infected + state.exposed + state.detected)[rows].sum(axis=1)
+        self.days_since_last_infection[rows] = np.where(
+            infections > 0, 0, self.days_since_last_infection[rows] + 1
+        )
+
+        active = state if rows.size == self.replicates else state.take(rows)
+
+        if self.keys is not None:
+            binomial = self._stream_binomial(rows)
+        else:
+            generator = self.generator
+
+            def binomial(n, p, transition):
+                return generator.binomial(n, p)
+
+        step(active, self.neighbour_sum, binomial, p)
+
+        if active is not state:
+            state.put(rows, active)
+
+        infected = (state.infected + state.detected)[rows].sum(axis=1)
+        self.peak_infected[rows] = np.maximum(self.peak_infected[rows], infected)
+        self.won[rows] = self.days_since_last_infection[rows] >= p.win_threshold
+        self.lost[rows] = ~self.won[rows] & (self.pct_dead[rows] >= p.lose_threshold)
+
+    def _stream_binomial(self, rows):
+        # replicates lead the (replicate, [transition,] place) draws
+        def binomial(n, p, transition):
+            leading = (-1,) + (1,) * (np.ndim(n) - 1)
+            key = tuple(words[rows].reshape(leading) for words in self.keys)
+            day = self.day[rows].reshape(leading)
+            return stream_binomial(self.streams, day, places, key=key)(n, p, transition)
+
+        places = np.arange(self.place_count)
+        return binomial
+
+    def run(self, days):
+        """Advance until every replicate is finished or `days` have passed."""
+        for _ in range(days):
+            if self.finished.all():
+                break
+            self.update()
+        return self
@@ -1,5 +1,7 @@
 import pyxel
+from profiling import PROFILER
 from sim import Pandemic
+from stepper import DayStepper
 import consts as c
 from components import (
     GameStats,
@@ -8,6 +10,10 @@ from components import (
     NextDayButton,
     InfoBox,
     SelectionButtons,
+    EpiCurve,
+    UndoButton,
+    PreviewButton,
+    ProfilerOverlay,
 )
 
 from map import Map, MapButton
@@ -31,6 +37,10 @@ class App:
 
         self.game_state = GameState()
         self.sim = Pandemic()
+        self.sim.track_history()
+        self.sim.track_undo()
+        self.stepper = DayStepper(self.sim)
+        self.epi_curve = EpiCurve()
         self.stats = GameStats()
         self.heading = Heading()
         self.selection_buttons = SelectionButtons()
@@ -64,26 +74,51 @@ class App:
                 width=c.SCREEN_WIDTH,
                 height=c.ROW_HEIGHT,
             )
-            for idx, place_data in enumerate(self.sim.cities.values())
+            for idx, place_data in enumerate(self.sim.cities)
         ]
 
         self.next_button = NextDayButton()
+        self.undo_button = UndoButton()
+        self.preview_button = PreviewButton()
+        self.profiler_overlay = ProfilerOverlay()
         pyxel.run(self.update, self.draw)
 
     def update(self):
+        self.profiler_overlay.update()
+        with PROFILER.span("App.update"):
+            self.update_components()
+
+    def update_components(self):
+        self.stepper.poll()
+
         self.intro.update(self.game_state)
         self.middle_game_info.update(self.game_state)
         self.end_game_info.update(self.game_state)
-        self.map.update(self.sim)
         self.map_button.update(self.game_state)
-        self.selection_buttons.update(game_state=self.game_state, sim=self.sim)
+        self.preview_button.update(self.sim)
+
+        # the game can't change while a day is being simulated
+        if self.stepper.busy:
+            return
 
-        for place in self.places:
-            place.update(self.sim)
+        with PROFILER.span("Map.update"):
+            self.map.update(self.sim)
+        with PROFILER.span("SelectionButtons.update"):
+            self.selection_buttons.update(game_state=self.game_state, sim=self.sim)
 
-        self.next_button.update(self.sim)
+        with PROFILER.span("Place.update"):
+            for place in self.places:
+                place.update(self.sim)
+
+        self.next_button.update(self.stepper)
+        self.undo_button.update(self.sim)
 
     def draw(self):
+        with PROFILER.span("App.draw"):
+            self.draw_components()
+        self.profiler_overlay.draw()
+
+    def draw_components(self):
         pyxel.cls(c.BACKGROUND_COLOR)
 
         if self.sim.days_since_last_infection == c.WIN_THRESHOLD:
@@ -109,18 +144,25 @@ class App:
             return
 
         if self.game_state.map_visible:
-            self.map.draw(self.game_state, self.sim)
+            with PROFILER.span("Map.draw"):
+                self.map.draw(self.game_state, self.sim)
 
         else:
             self.stats.draw(sim=self.sim)
-            for place in self.places:
-                place.draw(self.sim)
+            with PROFILER.span("Place.draw"):
+                for place in self.places:
+                    place.draw(self.sim, preview=self.preview_button.preview)
             self.heading.draw()
+            self.epi_curve.draw(sim=self.sim)
 
         # Draw next button
-        self.selection_buttons.draw(game_state=self.game_state)
-        self.next_button.draw()
+        with PROFILER.span("SelectionButtons.draw"):
+            self.selection_buttons.draw(game_state=self.game_state)
+        self.next_button.draw(busy=self.stepper.busy)
+        self.undo_button.draw(self.sim)
+        self.preview_button.draw()
         self.map_button.draw(self.game_state)
 
 
-App()
+if __name__ == "__main__":
+    App()
@@ -0,0 +1,85 @@
+import numpy as np
+from store import COMPARTMENTS
+
+
+class History:
+    """Preallocated ring buffers of the simulation state over time.
+
+    Every recorded day stores each compartment of every place, the totals
+    over all places and the control-measure bitmask of every place. Only
+    the last `capacity` records are kept, and with `every` > 1 only days
+    that are a multiple of `every` are recorded.
+
+    Each record is written twice, at slot i and i + capacity, so the last
+    `capacity` records are always one contiguous slice and the accessors
+    return views without copying. `rewind` drops the latest records, e.g.
+    on undo.
+    """
+
+    def __init__(self, place_count, capacity=1000, every=1):
+        self.place_count = place_count
+        self.capacity = capacity
+        self.every = every
+        self.count = 0
+        self.first = 0
+        self._days = np.zeros(2 * capacity, dtype=np.int32)
+        self._places = np.zeros(
+            (2 * capacity, len(COMPARTMENTS), place_count), dtype=np.int32
+        )
+        self._totals = np.zeros((2 * capacity, len(COMPARTMENTS)), dtype=np.int64)
+        self._measures = np.zeros((2 * capacity, place_count), dtype=np.uint8)
+
+    def __len__(self):
+        return self.count - self.first
+
+    def record(self, day, store):
+        """Append the state of `store` on `day`, in O(places)."""
+        if day % self.every:
+            return
+        slot = self.count % self.capacity
+        for row in (slot, slot + self.capacity):
+            self._days[row] = day
+            for idx, name in enumerate(COMPARTMENTS):
+                self._places[row, idx] = np.frombuffer(getattr(store, name), np.int32)
+                self._totals[row, idx] = store.totals[name]
+            self._measures[row] = np.frombuffer(store.measures, np.uint8)
+        self.count += 1
+        self.first = max(self.first, self.count - self.capacity)
+
+    def rewind(self, count):
+        """Forget the records after the first `count`.
+
+        Records overwritten since then are not recovered, so fewer than
+        `capacity` may remain.
+        """
+        self.count = count
+        self.first = min(self.first, count)
+
+    def _window(self, buffer):
+        end = (self.count - 1) % self.capacity + self.capacity + 1
+        return buffer[end - len(self) : end]
+
+    @property
+    def days(self):
+        return self._window(self._days)
+
+    @property
+    def places(self):
+        """(records, compartments, places) view, compartments in COMPARTMENTS order."""
+        return self._window(self._places)
+
+    @property
+    def totals(self):
+        """(records, compartments) view of the totals over all places."""
+        return self._window(self._totals)
+
+    @property
+    def measures(self):
+        """(records, places) view of the control-measure bitmasks."""
+        return self._window(self._measures)
+
+    def total(self, compartment):
+        return self.totals[:, COMPARTMENTS.index(compartment)]
+
+    def place(self, node, compartment):
+        return self.places[:, COMPARTMENTS.index(compartment), node]
@@ -0,0 +1,109 @@
+import math
+from dataclasses import replace
+import numpy as np
+from ensemble import Ensemble
+from network import barabasi_albert_network
+from params import Params
+
+# outcome of each replicate compared between the engines
+METRICS = ("dead", "peak_infected", "days", "won")
+
+
+def ks_2samp(a, b):
+    """Two-sample Kolmogorov-Smirnov statistic and its asymptotic p-value."""
+    a, b = np.sort(a), np.sort(b)
+    values = np.concatenate((a, b))
+    cdf_a = np.searchsorted(a, values, side="right") / a.size
+    cdf_b = np.searchsorted(b, values, side="right") / b.size
+    statistic = float(np.abs(cdf_a - cdf_b).max())
+    n = a.size * b.size / (a.size + b.size)
+    return statistic, _kolmogorov_sf(
+        (math.sqrt(n) + 0.12 + 0.11 / math.sqrt(n)) * statistic
+    )
+
+
+def _kolmogorov_sf(x):
+    # P(K > x) of the Kolmogorov distribution, as in Numerical Recipes
+    if x < 0.2:
+        return 1.0
+    total = sum((-1) ** (k - 1) * math.exp(-2 * k * k * x * x) for k in range(1, 101))
+    return min(max(2 * total, 0.0), 1.0)
+
+
+def outcomes(params, replicates, days, network, seed):
+    """Per-replicate METRICS and the mean infected + exposed curve."""
+    ensemble = Ensemble(replicates, network=network, seed=seed, params=params)
+    curve = []
+    for _ in range(days):
+        state = ensemble.state
+        curve.append((state.infected + state.exposed).sum(axis=1).mean())
+        if ensemble.finished.all():
+            break
+        ensemble.update()
+    curve += [curve[-1]] * (days - len(curve))
+    return {
+        "dead": ensemble.state.dead.sum(axis=1),
+        "peak_infected": ensemble.peak_infected,
+        "days": ensemble.day,
+        "won": ensemble.won.astype(np.int64),
+    }, np.array(curve)
+
+
+def compare(params=None, threshold=100, replicates=500, days=100, seed=0):
+    """Compare runs with `mean_field_threshold` = `threshold` to stochastic ones.
+
+    Both sets of replicates start from the same network and patients zero.
+    Returns, per metric, the two means and the KS statistic and p-value of
+    the two samples, next to those between two independent stochastic
+    samples as a baseline, and the largest gap between the mean epidemic
+    curves relative to the stochastic peak.
+    """
+    params = params if params is not None else Params.from_consts()
+    network = barabasi_albert_network(params.place_count, 2, seed=seed)
+    stochastic, stochastic_curve = outcomes(
+        replace(params, mean_field_threshold=0), replicates, days, network, seed
+    )
+    baseline, _ = outcomes(
+        replace(params, mean_field_threshold=0), replicates, days, network, seed + 1
+    )
+    hybrid, hybrid_curve = outcomes(
+        replace(params, mean_field_threshold=threshold), replicates, days, network, seed
+    )
+    report = {
+        name: {
+            "stochastic_mean": float(stochastic[name].mean()),
+            "hybrid_mean": float(hybrid[name].mean()),
+            **dict(zip(("ks", "p"), ks_2samp(stochastic[name], hybrid[name]))),
+            **dict(
+                zip(
+                    ("baseline_ks", "baseline_p"),
+                    ks_2samp(stochastic[name], baseline[name]),
+                )
+            ),
+        }
+        for name in METRICS
+    }
+    report["curve_gap"] = float(
+        np.abs(hybrid_curve - stochastic_curve).max() / max(stochastic_curve.max(), 1)
+    )
+    return report
+
+
+if __name__ == "__main__":
+    import time
+
+    # default-size schools, 150 kids each
+    params = Params.from_consts()
+    for threshold in (5, 10, 20, 50):
+        start = time.perf_counter()
+        report = compare(params, threshold=threshold, replicates=1000, days=200)
+        print(f"threshold {threshold} ({time.perf_counter() - start:.1f}s):")
+        for name in METRICS:
+            row = report[name]
+            print(
+                f"  {name:>13}: stochastic {row['stochastic_mean']:10.1f}"
+                + f"  hybrid {row['hybrid_mean']:10.1f}"
+                + f"  KS {row['ks']:.3f} (p={row['p']:.3f})"
+                + f"  baseline KS {row['baseline_ks']:.3f} (p={row['baseline_p']:.3f})"
+            )
+        print(f"  mean curve gap {report['curve_gap']:.1%} of the peak")
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import consts as c
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".layout_cache")
+ITERATIONS = 1000
+SEED = 42
+
+# most places fruchterman_reingold lays out, its steps take O(n^2) memory
+DENSE_LAYOUT_MAX_PLACES = 500
+
+
+def map_scaler(x, y, x_min, x_max, y_min, y_max):
+    # normalize x and y values to 0-1
+    x = (x - x_min) / (x_max - x_min)
+    y = (y - y_min) / (y_max - y_min)
+
+    # scale to screen size with border
+    x = x * (c.SCREEN_WIDTH - c.BORDER * 8) + c.BORDER * 4
+    y = y * (c.SCREEN_HEIGHT - c.BORDER * 8) + c.BORDER * 4
+    return x, y
+
+
+def scale_positions(pos):
+    """Scale layout positions (one (x, y) per node) to screen coordinates."""
+    xs = [x for x, _ in pos]
+    ys = [y for _, y in pos]
+    x_min, x_max = min(xs), max(xs)
+    y_min, y_max = min(ys), max(ys)
+
+    # a single place or a straight line has no extent to normalize by
+    if x_max == x_min:
+        x_min, x_max = x_min - 1, x_max + 1
+    if y_max == y_min:
+        y_min, y_max = y_min - 1, y_max + 1
+    return [map_scaler(x, y, x_min, x_max, y_min, y_max) for x, y in pos]
+
+
+def initial_positions(place_count):
+    return [(i // 5, i % 5) for i in range(place_count)]
+
+
+def spring_positions(edges, place_count):
+    """Run the spring layout, the only place networkx is imported.
+
+    Without networkx, as in the browser, `fruchterman_reingold` computes
+    the same layout, or a circle above `DENSE_LAYOUT_MAX_PLACES` places.
+    """
+    try:
+        import networkx as nx
+    except ImportError:
+        return scale_positions(fruchterman_reingold(edges, place_count))
+
+    graph = nx.Graph()
+    graph.add_nodes_from(range(place_count))
+    graph.add_edges_from(edges)
+    pos = nx.spring_layout(
+        graph,
+        pos=dict(enumerate(initial_positions(place_count))),
+        seed=SEED,
+        iterations=ITERATIONS,
+    )
+    return scale_positions([tuple(pos[i]) for i in range(place_count)])
+
+
+def fruchterman_reingold(edges, place_count, iterations=ITERATIONS, threshold=1e-4):
+    """Force-directed layout from `initial_positions`, one (x, y) per place.
+
+    The dense Fruchterman-Reingold steps of networkx's `spring_layout`,
+    which it uses below 500 nodes, before its final rescale. Each step
+    holds n x n arrays, so above `DENSE_LAYOUT_MAX_PLACES` (500) places
+    this returns the places on a circle instead.
+    """
+    import numpy as np
+
+    if place_count < 2:
+        return initial_positions(place_count)
+    if place_count > DENSE_LAYOUT_MAX_PLACES:
+        return _circle(place_count)
+    adjacency = np.zeros((place_count, place_count))
+    for i, j in edges:
+        adjacency[i, j] = adjacency[j, i] = 1.0
+    pos = np.array(initial_positions(place_count), dtype=float)
+
+    # optimal distance between places
+    k = np.sqrt(1.0 / place_count)
+    # the largest step, cooled linearly over the iterations
+    t = max(np.ptp(pos[:, 0]), np.ptp(pos[:, 1])) * 0.1
+    dt = t / (iterations + 1)
+    for _ in range(iterations):
+        delta = pos[:, np.newaxis, :] - pos[np.newaxis, :, :]
+        distance = np.linalg.norm(delta, axis=-1)
+        np.clip(distance, 0.01, None, out=distance)
+        displacement = np.einsum(
+            "ijk,ij->ik", delta, (k * k / distance**2 - adjacency * distance / k)
+        )
+        length = np.clip(np.linalg.norm(displacement, axis=-1), 0.01, None)
+        delta_pos = np.einsum("ij,i->ij", displacement, t / length)
+        pos += delta_pos
+        t -= dt
+        if np.linalg.norm(delta_pos) / place_count < threshold:
+            break
+    return [tuple(xy) for xy in pos.tolist()]
+
+
+def circle_positions(place_count):
+    """Cheap placeholder layout with the places on a circle."""
+    return scale_positions(_circle(place_count))
+
+
+def _circle(place_count):
+    return [
+        (
+            math.cos(2 * math.pi * i / place_count),
+            math.sin(2 * math.pi * i / place_count),
+        )
+        for i in range(place_count)
+    ]
+
+
+def graph_key(adjacency):
+    """Hash of the network and layout settings, used to key the cache."""
+    digest = hashlib.sha1()
+    digest.update(adjacency.offsets.tobytes())
+    digest.update(adjacency.neighbours.tobytes())
+    digest.update(
+        f"{ITERATIONS}:{SEED}:{c.SCREEN_WIDTH}:{c.SCREEN_HEIGHT}:{c.BORDER}".encode()
+    )
+    return digest.hexdigest()
+
+
+class MapLayout:
+    """Screen coordinates of every place and edge for the map.
+
+    The spring layout is computed once per network and kept in memory and
+    on disk under a hash of the graph, so restarts with the same network
+    skip it. While it is being computed in a background thread a circle
+    layout is shown instead. Where threads are unavailable, as in Pyodide,
+    the layout is computed on the first request.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, background=True):
+        self.cache_dir = cache_dir
+        self.background = background
+        self.key = None
+        self.ready = False
+        self.places = []
+        self.edges = []
+        self._adjacency = None
+        self._computed = {}
+        self._thread = None
+
+    def get(self, sim):
+        """Return (places, edges) for the simulation's current network."""
+        adjacency = sim.adjacency
+        if adjacency is not self._adjacency:
+            self._adjacency = adjacency
+            self._load(adjacency)
+        elif not self.ready and self.key in self._computed:
+            self._set(adjacency, self._computed[self.key], ready=True)
+        return self.places, self.edges
+
+    def _load(self, adjacency):
+        self.key = graph_key(adjacency)
+        positions = self._computed.get(self.key) or self._read(self.key)
+        if positions is not None:
+            self._set(adjacency, positions, ready=True)
+            return
+
+        self._set(adjacency, circle_positions(adjacency.place_count), ready=False)
+        edges = _edge_list(adjacency)
+        args = (self.key, edges, adjacency.place_count)
+        if self.background:
+            try:
+                self._thread = threading.Thread(
+                    target=self._compute, args=args, daemon=True
+                )
+                self._thread.start()
+                return
+            except RuntimeError:
+                self.background = False
+
+        self._compute(*args)
+        self._set(adjacency, self._computed[self.key], ready=True)
+
+    def _compute(self, key, edges, place_count):
+        positions = spring_positions(edges, place_count)
+        self._write(key, positions)
+        self._computed[key] = positions
+
+    def _set(self, adjacency, positions, ready):
+        self.places = positions
+        self.edges = [positions[i] + positions[j] for i, j in _edge_list(adjacency)]
+        self.ready = ready
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "r") as file:
+                return [tuple(xy) for xy in json.load(file)]
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, positions):
+        # the cache is an optimization, a read-only file system is fine
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._path(key), "w") as file:
+                json.dump(positions, file)
+        except OSError:
+            pass
+
+
+def _edge_list(adjacency):
+    offsets, neighbours = adjacency.offsets, adjacency.neighbours
+    return [
+        (i, j)
+        for i in range(adjacency.place_count)
+        for j in neighbours[offsets[i] : offsets[i + 1]]
+        if i < j
+    ]
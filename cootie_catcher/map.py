@@ -1,59 +1,128 @@
 from components import Clickable, Button, NextDayButton, ActionCheckbox
 import consts as c
+import heapq
 import pyxel
-import networkx as nx
-
-
-def map_scaler(x, y, x_min, x_max, y_min, y_max):
-    # normalize x and y values to 0-1
-    x = (x - x_min) / (x_max - x_min)
-    y = (y - y_min) / (y_max - y_min)
-
-    # scale to screen size with border
-    x = x * (c.SCREEN_WIDTH - c.BORDER * 8) + c.BORDER * 4
-    y = y * (c.SCREEN_HEIGHT - c.BORDER * 8) + c.BORDER * 4
-    return x, y
+from layout import MapLayout
 
 
 class MapPlaceMarker(Clickable):
-    def __init__(self, x, y, place_name):
+    def __init__(self, x, y, node):
         self.x = x - 5
         self.y = y - 5
         self.width = 10
         self.height = 10
-        self.place_name = place_name
+        self.node = node
+        self.color = None
 
-    def draw(self, game_state, prop_infected):
-        if game_state.map_selected_place == self.place_name:
+    def recolor(self, game_state, sim):
+        """Pick the marker color for the current state, True if it changed."""
+        if game_state.map_selected_place == self.node:
             color = c.DARK
-        elif prop_infected == 0:
-            color = c.GREEN
-        elif prop_infected < 0.1:
-            color = c.ORANGE
         else:
-            color = c.ALERT_COLOR
+            prop_infected = (
+                sim.store.detected[self.node] / sim.store.population[self.node]
+            )
+            if prop_infected == 0:
+                color = c.GREEN
+            elif prop_infected < 0.1:
+                color = c.ORANGE
+            else:
+                color = c.ALERT_COLOR
 
-        if self.is_hovered():
-            pyxel.circ(self.x + 5, self.y + 5, self.width, c.HIGHLIGHT_COLOR_DARK)
-        else:
-            pyxel.circ(self.x + 5, self.y + 5, self.width / 2, color)
+        changed = color != self.color
+        self.color = color
+        return changed
+
+    def draw(self, image):
+        image.circ(self.x + 5, self.y + 5, self.width / 2, self.color)
 
+    def draw_hover(self):
+        pyxel.circ(self.x + 5, self.y + 5, self.width, c.HIGHLIGHT_COLOR_DARK)
+
+    def update(self, game_state):
         if self.is_clicked():
-            if game_state.map_selected_place == self.place_name:
+            if game_state.map_selected_place == self.node:
                 game_state.map_selected_place = None
             else:
-                game_state.map_selected_place = self.place_name
+                game_state.map_selected_place = self.node
 
 
-class MapEdge:
-    def __init__(self, x1, y1, x2, y2):
-        self.x1 = x1
-        self.y1 = y1
-        self.x2 = x2
-        self.y2 = y2
+class MapLayer:
+    """Background, edges and place markers pre-rendered into one image.
 
-    def draw(self):
-        pyxel.line(self.x1, self.y1, self.x2, self.y2, c.DARK)
+    The image is built once per layout and blitted every frame. Markers are
+    recolored only when the day or the selection changes, and only those
+    whose color changed are redrawn, together with any later markers they
+    overlap so the drawing order is kept.
+    """
+
+    cell_size = 10
+
+    def __init__(self):
+        self.image = None
+        self.places = None
+        self.markers = []
+        self.grid = {}
+        self.state = None
+
+    def build(self, places, edges):
+        if self.image is None:
+            self.image = pyxel.Image(c.SCREEN_WIDTH, c.SCREEN_HEIGHT)
+        self.image.rect(0, 0, c.SCREEN_WIDTH, c.SCREEN_HEIGHT, c.LIGHT)
+        for x1, y1, x2, y2 in edges:
+            self.image.line(x1, y1, x2, y2, c.DARK)
+
+        self.places = places
+        self.markers = [
+            MapPlaceMarker(x, y, node) for node, (x, y) in enumerate(places)
+        ]
+        self.grid = {}
+        for marker in self.markers:
+            self.grid.setdefault(self._cell(marker.x, marker.y), []).append(marker)
+        self.state = None
+
+    def update_markers(self, game_state, sim):
+        state = (sim.store, sim.generation, game_state.map_selected_place)
+        if state == self.state:
+            return
+        self.state = state
+
+        redraw = [
+            marker.node for marker in self.markers if marker.recolor(game_state, sim)
+        ]
+        heapq.heapify(redraw)
+        drawn = set()
+        while redraw:
+            node = heapq.heappop(redraw)
+            if node in drawn:
+                continue
+            drawn.add(node)
+            marker = self.markers[node]
+            marker.draw(self.image)
+            for other in self._nearby(marker.x, marker.y):
+                if (
+                    other.node > node
+                    and abs(other.x - marker.x) <= other.width
+                    and abs(other.y - marker.y) <= other.height
+                ):
+                    heapq.heappush(redraw, other.node)
+
+    def marker_at(self, x, y):
+        """Return the topmost marker under the point, if any."""
+        hovered = None
+        for marker in self._nearby(x - 5, y - 5):
+            if marker.is_hovered() and (hovered is None or marker.node > hovered.node):
+                hovered = marker
+        return hovered
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def _nearby(self, x, y):
+        cell_x, cell_y = self._cell(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield from self.grid.get((cell_x + dx, cell_y + dy), ())
 
 
 class MapButton(Button):
@@ -82,25 +151,46 @@ class MapButton(Button):
 
 class SelectionBox:
     def __init__(self):
-        self.action_checkboxes = []
+        self.stats_key = None
+        self.place_stats = []
+        self.action_checkboxes = [
+            ActionCheckbox(
+                x=c.BORDER + 5 + len(c.ACTIONS[action]) * c.CHARACTER_WIDTH + 5,
+                y=c.BORDER + c.CHARACTER_HEIGHT * (5 + 3 + idx),
+                size=5,
+                node=None,
+                action_name=action,
+            )
+            for idx, action in enumerate(c.ACTIONS)
+        ]
 
     def update(self, sim):
         for checkbox in self.action_checkboxes:
-            checkbox.update(sim)
+            if checkbox.node is not None:
+                checkbox.update(sim)
 
     def draw(self, game_state, sim):
-        if game_state.map_selected_place:
+        node = game_state.map_selected_place
+        for checkbox in self.action_checkboxes:
+            checkbox.node = node
+
+        if node is not None:
             pyxel.rect(x=c.BORDER, y=c.BORDER, w=110, h=75, col=c.LIGHT)
             pyxel.rectb(x=c.BORDER, y=c.BORDER, w=110, h=75, col=c.DARK)
-            selected_place = sim.cities[game_state.map_selected_place]
-            place_stats = [
-                f"{selected_place.place_name}",
-                f"Caught Cooties: {selected_place.detected}",
-                f"Treated: {selected_place.treated}",
-                f"Homeschooled: {selected_place.dead}",
-                f"Anger: {selected_place.anger}/5",
-            ]
-            for idx, stat in enumerate(place_stats):
+
+            # stats only change with the game state or the selected place
+            key = (sim.store, sim.generation, node)
+            if self.stats_key != key:
+                self.stats_key = key
+                selected_place = sim.cities[node]
+                self.place_stats = [
+                    f"{selected_place.place_name}",
+                    f"Caught Cooties: {selected_place.detected}",
+                    f"Treated: {selected_place.treated}",
+                    f"Homeschooled: {selected_place.dead}",
+                    f"Anger: {selected_place.anger}/5",
+                ]
+            for idx, stat in enumerate(self.place_stats):
                 pyxel.text(
                     x=c.BORDER + 5,
                     y=c.BORDER + c.CHARACTER_HEIGHT * (1 + idx),
@@ -108,22 +198,15 @@ class SelectionBox:
                     col=c.DARK,
                 )
             # draw actions
-            self.action_checkboxes = []
-            for idx, action in enumerate(c.ACTIONS):
+            for idx, (action, checkbox) in enumerate(
+                zip(c.ACTIONS, self.action_checkboxes)
+            ):
                 pyxel.text(
                     x=c.BORDER + 5,
-                    y=c.BORDER + c.CHARACTER_HEIGHT * (len(place_stats) + 3 + idx),
+                    y=c.BORDER + c.CHARACTER_HEIGHT * (len(self.place_stats) + 3 + idx),
                     s=f"{c.ACTIONS[action]}: ",
                     col=c.DARK,
                 )
-                checkbox = ActionCheckbox(
-                    x=c.BORDER + 5 + len(c.ACTIONS[action]) * c.CHARACTER_WIDTH + 5,
-                    y=c.BORDER + c.CHARACTER_HEIGHT * (len(place_stats) + 3 + idx),
-                    size=5,
-                    place_name=selected_place.place_name,
-                    action_name=action,
-                )
-                self.action_checkboxes.append(checkbox)
                 checkbox.draw(sim)
 
 
@@ -131,6 +214,8 @@ class Map:
     def __init__(self):
         self.visible = True
         self.selection_box = SelectionBox()
+        self.layout = MapLayout()
+        self.layer = MapLayer()
 
     def update(self, sim):
         if self.visible:
@@ -138,43 +223,16 @@ class Map:
 
     def draw(self, game_state, sim):
 
-        # draw background
-        pyxel.rect(0, 0, c.SCREEN_WIDTH, c.SCREEN_HEIGHT, c.LIGHT)
-
-        # draw network
-
-        # Create a graph from the network
-        graph = nx.Graph(sim.network)
-
-        # Specify the positions of the nodes
-        pos = nx.spring_layout(
-            graph,
-            pos={i: (i // 5, i % 5) for i in range(c.PLACE_COUNT)},
-            seed=42,
-            iterations=1000,
-        )
-
-        # x and y min and max values
-        xs = [x for x, _ in pos.values()]
-        ys = [y for _, y in pos.values()]
-        x_min, x_max = min(xs), max(xs)
-        y_min, y_max = min(ys), max(ys)
-
-        for edge in graph.edges:
-            x1, y1 = pos[edge[0]]
-            x2, y2 = pos[edge[1]]
-            x1, y1 = map_scaler(x1, y1, x_min, x_max, y_min, y_max)
-            x2, y2 = map_scaler(x2, y2, x_min, x_max, y_min, y_max)
-
-            MapEdge(x1, y1, x2, y2).draw()
-
-        for place in sim.cities.values():
-            x, y = pos[place.node]
-
-            # Normalize x and y values
-            x, y = map_scaler(x, y, x_min, x_max, y_min, y_max)
-            MapPlaceMarker(x, y, place.place_name).draw(
-                game_state=game_state, prop_infected=place.detected / place.population()
-            )
+        # the background, network and markers are pre-rendered
+        places, edges = self.layout.get(sim)
+        if places is not self.layer.places:
+            self.layer.build(places, edges)
+        self.layer.update_markers(game_state, sim)
+        pyxel.blt(0, 0, self.layer.image, 0, 0, c.SCREEN_WIDTH, c.SCREEN_HEIGHT)
+
+        marker = self.layer.marker_at(pyxel.mouse_x, pyxel.mouse_y)
+        if marker is not None:
+            marker.draw_hover()
+            marker.update(game_state)
 
         self.selection_box.draw(game_state, sim)
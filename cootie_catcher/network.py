@@ -0,0 +1,240 @@
+import numbers
+import random
+from array import array
+
+
+class Network:
+    """Undirected graph of places, with the part of the networkx Graph API
+    the game uses.
+
+    Neighbours are kept in insertion order, as networkx keeps them, so
+    indexes built from a network match those of the networkx graph it
+    replaced. `version` counts mutations; indexes derived from the graph
+    compare it to know when they are stale. `to_networkx` builds a
+    networkx graph for anything else, importing networkx only then.
+    """
+
+    def __init__(self, edges=None):
+        self._adj = {}
+        self.version = 0
+        if edges is not None:
+            self.add_edges_from(edges)
+
+    def __len__(self):
+        return len(self._adj)
+
+    def __iter__(self):
+        return iter(self._adj)
+
+    def __contains__(self, node):
+        return node in self._adj
+
+    @property
+    def nodes(self):
+        return list(self._adj)
+
+    @property
+    def edges(self):
+        seen = set()
+        edges = []
+        for node, neighbours in self._adj.items():
+            edges.extend(
+                (node, neighbour) for neighbour in neighbours if neighbour not in seen
+            )
+            seen.add(node)
+        return edges
+
+    @property
+    def degree(self):
+        """View of each node's number of neighbours, `degree[node]`."""
+        return DegreeView(self._adj)
+
+    def number_of_nodes(self):
+        return len(self._adj)
+
+    def number_of_edges(self):
+        return sum(len(neighbours) for neighbours in self._adj.values()) // 2
+
+    def neighbors(self, node):
+        return iter(self._adj[node])
+
+    def has_edge(self, u, v):
+        return u in self._adj and v in self._adj[u]
+
+    def add_node(self, node):
+        self.version += 1
+        self._adj.setdefault(node, {})
+
+    def add_nodes_from(self, nodes):
+        self.version += 1
+        for node in nodes:
+            self._adj.setdefault(node, {})
+
+    def add_edge(self, u, v):
+        self.version += 1
+        self._adj.setdefault(u, {})[v] = None
+        self._adj.setdefault(v, {})[u] = None
+
+    def add_edges_from(self, edges):
+        self.version += 1
+        adj = self._adj
+        for u, v in edges:
+            adj.setdefault(u, {})[v] = None
+            adj.setdefault(v, {})[u] = None
+
+    def remove_node(self, node):
+        self.version += 1
+        for neighbour in self._adj.pop(node):
+            if neighbour != node:
+                del self._adj[neighbour][node]
+
+    def remove_nodes_from(self, nodes):
+        for node in nodes:
+            if node in self._adj:
+                self.remove_node(node)
+
+    def remove_edge(self, u, v):
+        self.version += 1
+        del self._adj[u][v]
+        if u != v:
+            del self._adj[v][u]
+
+    def remove_edges_from(self, edges):
+        for u, v in edges:
+            if self.has_edge(u, v):
+                self.remove_edge(u, v)
+
+    def clear(self):
+        self.version += 1
+        self._adj.clear()
+
+    def clear_edges(self):
+        self.version += 1
+        for neighbours in self._adj.values():
+            neighbours.clear()
+
+    def to_networkx(self):
+        import networkx as nx
+
+        graph = nx.Graph()
+        graph.add_nodes_from(self._adj)
+        graph.add_edges_from(self.edges)
+        return graph
+
+
+class DegreeView:
+    """Degrees read from a network's neighbours; iterates (node, degree)."""
+
+    def __init__(self, adj):
+        self._adj = adj
+
+    def __getitem__(self, node):
+        return len(self._adj[node])
+
+    def __iter__(self):
+        return ((node, len(neighbours)) for node, neighbours in self._adj.items())
+
+    def __len__(self):
+        return len(self._adj)
+
+
+def barabasi_albert_network(n, m, seed=None):
+    """Barabási–Albert preferential attachment network of `n` places.
+
+    Grows a star on m + 1 nodes by adding nodes with `m` edges each, to
+    distinct existing nodes picked with probability proportional to their
+    degree. Draws the same numbers as networkx's `barabasi_albert_graph`
+    and gives the same graph for the same `seed`: None for the `random`
+    module, an int, or a `random.Random`.
+    """
+    if m < 1 or m >= n:
+        raise ValueError(
+            f"Barabási–Albert network must have m >= 1 and m < n, m = {m}, n = {n}"
+        )
+    if seed is None:
+        rng = random._inst
+    elif isinstance(seed, numbers.Integral):
+        rng = random.Random(int(seed))
+    else:
+        rng = seed
+
+    network = Network()
+    network.add_nodes_from(range(m + 1))
+    network.add_edges_from((0, node) for node in range(1, m + 1))
+
+    # nodes repeated once per edge end, so uniform picks follow the degree
+    repeated_nodes = [0] * m + list(range(1, m + 1))
+    for source in range(m + 1, n):
+        targets = set()
+        while len(targets) < m:
+            targets.add(rng.choice(repeated_nodes))
+        network.add_edges_from(zip([source] * m, targets))
+        repeated_nodes.extend(targets)
+        repeated_nodes.extend([source] * m)
+    return network
+
+
+class Adjacency:
+    """Compressed sparse row neighbour index of a network.
+
+    The neighbours of place i are neighbours[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.version = getattr(network, "version", 0)
+        self.place_count = network.number_of_nodes()
+        self.offsets = array("q", [0])
+        self.neighbours = array("q")
+        for node in range(self.place_count):
+            self.neighbours.extend(network.neighbors(node))
+            self.offsets.append(len(self.neighbours))
+
+    @classmethod
+    def from_arrays(cls, offsets, neighbours):
+        """Index restored from its arrays, with no network built yet."""
+        adjacency = cls.__new__(cls)
+        adjacency.network = None
+        adjacency.version = 0
+        adjacency.place_count = len(offsets) - 1
+        adjacency.offsets = array("q")
+        adjacency.offsets.frombytes(memoryview(offsets).cast("B"))
+        adjacency.neighbours = array("q")
+        adjacency.neighbours.frombytes(memoryview(neighbours).cast("B"))
+        return adjacency
+
+    def to_network(self):
+        """Build the `Network` this index describes and mark the index current."""
+        network = Network()
+        network.add_nodes_from(range(self.place_count))
+        network.add_edges_from(
+            (i, j)
+            for i in range(self.place_count)
+            for j in self.neighbours_of(i)
+            if i < j
+        )
+        self.network = network
+        self.version = network.version
+        return network
+
+    def detach(self):
+        """Drop the reference to the network, `to_network` rebuilds it."""
+        self.network = None
+        self.version = 0
+        return self
+
+    def is_current(self, network):
+        return network is self.network and self.version == getattr(
+            network, "version", 0
+        )
+
+    def neighbours_of(self, node):
+        return self.neighbours[self.offsets[node] : self.offsets[node + 1]]
+
+    def neighbour_sum(self, values):
+        """Sum `values` (one per place) over each place's neighbours."""
+        offsets, neighbours = self.offsets, self.neighbours
+        return [
+            sum([values[j] for j in neighbours[offsets[i] : offsets[i + 1]]])
+            for i in range(self.place_count)
+        ]
@@ -0,0 +1,314 @@
+import multiprocessing
+import threading
+from dataclasses import dataclass
+import numpy as np
+from engine import NeighbourSum, PlaceArrays, step, stream_binomial, sync_totals
+from network import Adjacency
+from partition import partition
+from profiling import PROFILER
+from store import PlaceStore
+from streams import CounterStreams
+
+
+@dataclass
+class Part:
+    """The places one worker simulates, and what it exchanges with the others.
+
+    Places are renumbered so every part owns the contiguous range
+    [start, end) of the shared arrays. `nodes` are their original nodes,
+    which address the counter streams. `offsets` and `neighbours` index the
+    part's own places followed by its halo, the places of other parts that
+    neighbour it, whose shared positions are `halo`. `boundary` are the
+    part's own places that are in another part's halo.
+    """
+
+    index: int
+    start: int
+    end: int
+    nodes: np.ndarray
+    offsets: np.ndarray
+    neighbours: np.ndarray
+    halo: np.ndarray
+    boundary: np.ndarray
+
+
+def split(adjacency, labels):
+    """Renumber places by part and build each part's local index.
+
+    Returns the place order, original node by shared position, and a list
+    of `Part`.
+    """
+    place_count = adjacency.place_count
+    offsets = np.frombuffer(adjacency.offsets, dtype=np.int64)
+    neighbours = np.frombuffer(adjacency.neighbours, dtype=np.int64)
+    degree = np.diff(offsets)
+
+    order = np.argsort(labels, kind="stable")
+    position = np.empty(place_count, dtype=np.int64)
+    position[order] = np.arange(place_count)
+    ends = np.cumsum(np.bincount(labels))
+
+    parts = []
+    for index, end in enumerate(ends.tolist()):
+        start = end - int(np.count_nonzero(labels == index))
+        nodes = order[start:end]
+        lengths = degree[nodes]
+        local_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        # edge slots of each owned place, in CSR order
+        slots = np.repeat(offsets[nodes] - local_offsets[:-1], lengths) + np.arange(
+            local_offsets[-1]
+        )
+        targets = position[neighbours[slots]]
+        internal = (targets >= start) & (targets < end)
+        halo = np.unique(targets[~internal])
+        local_neighbours = np.where(
+            internal,
+            targets - start,
+            end - start + np.searchsorted(halo, targets),
+        )
+        rows = np.repeat(np.arange(end - start), lengths)
+        parts.append(
+            Part(
+                index=index,
+                start=start,
+                end=end,
+                nodes=nodes,
+                offsets=local_offsets,
+                neighbours=local_neighbours,
+                halo=halo,
+                boundary=np.unique(rows[~internal]),
+            )
+        )
+    return order, parts
+
+
+def _layout(place_count, parts):
+    # name: (offset, shape, dtype) of each array in the shared block
+    # the same types as the PlaceStore arrays the state is copied from
+    shapes = {
+        name: ((place_count,), np.dtype(bool if name == "in_backlash" else typecode))
+        for name, typecode in PlaceStore.typecodes.items()
+        if name in PlaceArrays.fields
+    }
+    shapes["exchange"] = ((2, place_count), np.dtype(np.int64))
+    shapes["last_infected"] = ((parts,), np.dtype(np.int64))
+    shapes["control"] = ((2,), np.dtype(np.int64))
+
+    layout = {}
+    size = 0
+    for name, (shape, dtype) in shapes.items():
+        layout[name] = (size, shape, dtype.str)
+        size += -(-int(np.prod(shape)) * dtype.itemsize // 8) * 8
+    return layout, size
+
+
+def _views(buffer, layout):
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        for name, (offset, shape, dtype) in layout.items()
+    }
+
+
+def _simulate(part, arrays, params, streams, first_day, days):
+    # advances one part by `days`, yielding whenever its boundary counts
+    # are published and the other parts' must be awaited
+    state = PlaceArrays(0)
+    for name in state.fields:
+        setattr(state, name, arrays[name][part.start : part.end])
+    local_sum = NeighbourSum(Adjacency.from_arrays(part.offsets, part.neighbours))
+    halo = np.zeros(part.halo.size, dtype=np.int64)
+
+    def neighbour_sum(values):
+        return local_sum(np.concatenate((values, halo)))
+
+    last_infected = arrays["last_infected"]
+    for idx in range(days):
+        day = first_day + idx + 1
+        # alternate buffers, so a part that runs ahead writes the next day's
+        # counts while slower parts still read today's
+        exchange = arrays["exchange"][idx % 2]
+        contagious = state.infected + state.exposed
+        exchange[part.start + part.boundary] = contagious[part.boundary]
+        if contagious.any() or state.detected.any():
+            last_infected[part.index] = day
+        yield
+
+        halo[:] = exchange[part.halo]
+        step(
+            state,
+            neighbour_sum,
+            stream_binomial(streams, day, part.nodes),
+            params,
+        )
+
+
+def _worker(layout, block_name, part, params, stream_seed, start, done, exchanged):
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(name=block_name)
+    arrays = _views(block.buf, layout)
+    streams = CounterStreams(stream_seed)
+    while True:
+        start.acquire()
+        first_day, days = arrays["control"].tolist()
+        if days < 0:
+            break
+        try:
+            for _ in _simulate(part, arrays, params, streams, first_day, days):
+                exchanged.wait()
+        except threading.BrokenBarrierError:
+            # another worker failed, the parent is shutting down
+            return
+        done.release()
+
+
+class PartitionedSimulation:
+    """Steps a `Pandemic` with its network split across worker processes.
+
+    The network is partitioned into `parts` balanced parts with few cut
+    edges and each part is simulated by its own process. The state lives
+    in one shared memory block; every day each part publishes the
+    infected + exposed counts of its boundary places, waits for the
+    others, and reads those of its halo, which is all `update_place`
+    needs from neighbours. Draws come from the game's counter streams, so
+    the result is bit-identical to the single-process engines.
+
+    With `processes` false, or where processes or shared memory are
+    unavailable as in the browser, the parts are stepped in turn in this
+    process. Use as a context manager, or call `close`, to stop the
+    workers and free the shared memory.
+    """
+
+    def __init__(self, pandemic, parts, processes=True):
+        if pandemic.streams is None:
+            raise ValueError(
+                "Partitioned runs need counter streams, "
+                + "create the Pandemic with counter_rng=True"
+            )
+        self.pandemic = pandemic
+        self.labels = partition(pandemic.adjacency, parts)
+        self.order, self.parts = split(pandemic.adjacency, self.labels)
+        self.layout, size = _layout(len(self.order), len(self.parts))
+
+        self.block = None
+        self.workers = []
+        if processes and len(self.parts) > 1:
+            try:
+                self._start_workers(size)
+            except (ImportError, OSError):
+                self.close()
+        if self.block is None:
+            self.arrays = _views(bytearray(size), self.layout)
+
+    def _start_workers(self, size):
+        from multiprocessing import shared_memory
+
+        self.block = shared_memory.SharedMemory(create=True, size=size)
+        self.arrays = _views(self.block.buf, self.layout)
+        context = multiprocessing.get_context()
+        self._start = context.Semaphore(0)
+        self._done = context.Semaphore(0)
+        self._exchanged = context.Barrier(len(self.parts))
+        p = self.pandemic
+        for part in self.parts:
+            worker = context.Process(
+                target=_worker,
+                args=(
+                    self.layout,
+                    self.block.name,
+                    part,
+                    p.params,
+                    p.streams.seed,
+                    self._start,
+                    self._done,
+                    self._exchanged,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def advance(self, days=1):
+        """Advance the game by `days`, as that many calls to `update` would.
+
+        Undo and history see the whole advance as one step.
+        """
+        with PROFILER.span("PartitionedSimulation.advance"):
+            self._advance(days)
+        PROFILER.flush("PartitionedSimulation.advance")
+
+    def _advance(self, days):
+        p = self.pandemic
+        store = p.store
+        arrays = self.arrays
+        state = PlaceArrays.view(store)
+        for name in state.fields:
+            arrays[name][:] = getattr(state, name)[self.order]
+        arrays["last_infected"][:] = -1
+        arrays["control"][:] = (p.day, days)
+
+        if self.workers:
+            self._run_workers()
+        else:
+            simulations = [
+                _simulate(part, arrays, p.params, p.streams, p.day, days)
+                for part in self.parts
+            ]
+            while simulations:
+                simulations = [
+                    simulation
+                    for simulation in simulations
+                    if next(simulation, StopIteration) is not StopIteration
+                ]
+
+        # the game is untouched until every part has finished
+        p._save_undo()
+        for name in state.fields:
+            getattr(state, name)[self.order] = arrays[name]
+        sync_totals(store, state)
+
+        # only the last day that started with infections matters
+        last_infected = int(arrays["last_infected"].max())
+        for day in range(p.day + 1, p.day + days + 1):
+            p._start_day(1 if day <= last_infected else 0)
+        p.generation += 1
+        p._record_history()
+
+    def _run_workers(self):
+        for _ in self.workers:
+            self._start.release()
+        pending = len(self.workers)
+        while pending:
+            if self._done.acquire(timeout=0.1):
+                pending -= 1
+                continue
+            failed = [worker for worker in self.workers if not worker.is_alive()]
+            if failed:
+                self._exchanged.abort()
+                exitcode = failed[0].exitcode
+                self.close()
+                raise RuntimeError(f"A partition worker exited with code {exitcode}")
+
+    def close(self):
+        if self.workers:
+            if all(worker.is_alive() for worker in self.workers):
+                self.arrays["control"][:] = (0, -1)
+                for _ in self.workers:
+                    self._start.release()
+            for worker in self.workers:
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            self.workers = []
+        if self.block is not None:
+            self.arrays = None
+            self.block.close()
+            self.block.unlink()
+            self.block = None
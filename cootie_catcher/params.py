@@ -0,0 +1,40 @@
+import consts as c
+from dataclasses import dataclass, fields
+
+
+@dataclass(frozen=True)
+class Params:
+    """Model parameters for one simulation, named after their consts."""
+
+    total_population: int
+    place_count: int
+    travel_rate: float
+    infection_rate: float
+    incubation_rate: float
+    detection_rate: float
+    treatment_rate: float
+    treatment_capacity: float
+    mortality_rate: float
+    recovery_rate: float
+    contacts: int
+    mass_testing_detection_rate: float
+    contact_tracing_capacity: int
+    action_budget_beginning: int
+    action_budget_middle: int
+    action_budget_end: int
+    anger_threshold: int
+    middle_cutoff: int
+    end_cutoff: int
+    win_threshold: int
+    lose_threshold: int
+    mean_field_threshold: int = 0
+
+    @classmethod
+    def from_consts(cls, **overrides):
+        """Read the current values in consts, replacing any given overrides."""
+        values = {field.name: getattr(c, field.name.upper()) for field in fields(cls)}
+        unknown = set(overrides) - set(values)
+        if unknown:
+            raise TypeError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        values.update(overrides)
+        return cls(**values)
@@ -0,0 +1,77 @@
+from collections import deque
+import numpy as np
+
+
+def partition(adjacency, parts, imbalance=0.03, passes=4):
+    """Split the places of an `Adjacency` into `parts` balanced parts.
+
+    Places are ordered breadth-first from a low-degree place and the order
+    is cut into equal chunks, so each part starts out connected. A few
+    passes then move boundary places to the neighbouring part holding most
+    of their neighbours, as long as no part grows beyond `imbalance` above
+    an equal share. Returns the part of each place as an int array.
+    """
+    place_count = adjacency.place_count
+    parts = max(1, min(parts, place_count))
+    offsets = np.frombuffer(adjacency.offsets, dtype=np.int64)
+    neighbours = np.frombuffer(adjacency.neighbours, dtype=np.int64)
+    degree = np.diff(offsets)
+
+    order = _bfs_order(adjacency, np.argsort(degree, kind="stable"))
+    labels = np.empty(place_count, dtype=np.int64)
+    labels[order] = np.arange(place_count) * parts // place_count
+    if parts == 1:
+        return labels
+
+    capacity = int(np.ceil(place_count / parts * (1 + imbalance)))
+    rows = np.repeat(np.arange(place_count), degree)
+    for _ in range(passes):
+        counts = np.zeros((place_count, parts), dtype=np.int64)
+        np.add.at(counts, (rows, labels[neighbours]), 1)
+        best = counts.argmax(axis=1)
+        gain = (
+            counts[np.arange(place_count), best]
+            - counts[np.arange(place_count), labels]
+        )
+
+        sizes = np.bincount(labels, minlength=parts)
+        moved = 0
+        for node in np.flatnonzero(gain > 0)[np.argsort(-gain[gain > 0])]:
+            source, target = labels[node], best[node]
+            if sizes[target] < capacity and sizes[source] > 1:
+                labels[node] = target
+                sizes[source] -= 1
+                sizes[target] += 1
+                moved += 1
+        if not moved:
+            break
+    return labels
+
+
+def cut_edges(adjacency, labels):
+    """Number of edges between places in different parts."""
+    offsets = np.frombuffer(adjacency.offsets, dtype=np.int64)
+    neighbours = np.frombuffer(adjacency.neighbours, dtype=np.int64)
+    rows = np.repeat(np.arange(adjacency.place_count), np.diff(offsets))
+    return int(np.count_nonzero(labels[rows] != labels[neighbours])) // 2
+
+
+def _bfs_order(adjacency, starts):
+    # breadth-first order over every component, each started at the
+    # first unvisited place in `starts`
+    offsets, neighbours = adjacency.offsets, adjacency.neighbours
+    visited = bytearray(adjacency.place_count)
+    order = []
+    for start in starts.tolist():
+        if visited[start]:
+            continue
+        visited[start] = 1
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for neighbour in neighbours[offsets[node] : offsets[node + 1]]:
+                if not visited[neighbour]:
+                    visited[neighbour] = 1
+                    queue.append(neighbour)
+    return np.array(order, dtype=np.int64)
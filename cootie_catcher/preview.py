@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+import numpy as np
+from ensemble import Ensemble
+from store import COMPARTMENTS
+
+
+@dataclass
+class Preview:
+    """Distribution of per-place changes over the previewed days.
+
+    `expected` has shape (compartments, places) and `quantiles` maps each
+    quantile to an array of the same shape; compartments are in
+    COMPARTMENTS order.
+    """
+
+    day: int
+    days: int
+    rollouts: int
+    expected: np.ndarray
+    quantiles: dict
+
+    def expected_change(self, compartment, node):
+        return float(self.expected[COMPARTMENTS.index(compartment), node])
+
+    def expected_total_change(self, compartment):
+        return float(self.expected[COMPARTMENTS.index(compartment)].sum())
+
+
+def preview(pandemic, rollouts=100, days=1, quantiles=(0.1, 0.5, 0.9), seed=None):
+    """Roll the game forward `days` days `rollouts` times under its current
+    control measures and summarize the change at every place.
+
+    Rollouts are advanced together as an `Ensemble` and leave the game and
+    its random state untouched. Rollouts that are won or lost stop early.
+    """
+    ensemble = Ensemble.from_pandemic(pandemic, rollouts, seed=seed)
+    start = np.stack(
+        [
+            np.frombuffer(getattr(pandemic.store, name), np.int32)
+            for name in COMPARTMENTS
+        ]
+    )
+    ensemble.run(days)
+
+    # (rollouts, compartments, places)
+    change = np.stack([getattr(ensemble.state, name) for name in COMPARTMENTS], axis=1)
+    change -= start
+    return Preview(
+        day=pandemic.day,
+        days=days,
+        rollouts=rollouts,
+        expected=change.mean(axis=0),
+        quantiles=dict(zip(quantiles, np.quantile(change, quantiles, axis=0))),
+    )
@@ -0,0 +1,202 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# samples of each name kept for the rolling summary
+DEFAULT_WINDOW = 120
+
+# trace events kept, the oldest are dropped beyond this
+DEFAULT_MAX_EVENTS = 1_000_000
+
+_NO_SPAN = nullcontext()
+
+
+class Profiler:
+    """Timings of the simulation and game loop, off unless `enable`d.
+
+    Two kinds of timings are taken. `span(name)` times a block, such as a
+    frame or a component's draw, as one Chrome trace event. Inside hot
+    loops, code takes a `clock` and calls `lap(name, start)` at the end of
+    each phase, which only adds to a per-phase total; `count` adds to a
+    counter the same way. `flush` turns the totals since the last flush
+    into one counter event each, so a day of the simulation is one trace
+    sample per phase instead of one per place.
+
+    While disabled, `span` returns a shared no-op context manager; hot
+    loops should check `enabled` once, as in `Pandemic.update_place`, and
+    skip the calls altogether.
+
+    Every span and flushed phase also goes into a rolling window of the
+    last `window` samples, see `summary` and `last`. `chrome_trace` gives
+    the events in the Trace Event Format read by chrome://tracing and
+    Perfetto.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, max_events=DEFAULT_MAX_EVENTS):
+        self.enabled = False
+        self.window = window
+        self.events = deque(maxlen=max_events)
+        self.recent = {}
+        self.phases = {}
+        self.counts = {}
+        self._origin = time.perf_counter()
+
+    def __bool__(self):
+        return self.enabled
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Drop every event, sample and pending total."""
+        self.events.clear()
+        self.recent.clear()
+        self.phases.clear()
+        self.counts.clear()
+        self._origin = time.perf_counter()
+
+    def clock(self):
+        return time.perf_counter()
+
+    def lap(self, name, start):
+        """Add the time since `start` to phase `name`, returns the time now."""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - start
+        return now
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def span(self, name):
+        """Context manager timing a block as one trace event."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def record(self, name, start, end):
+        """Add a finished span, with perf_counter start and end times."""
+        self.events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": self._micros(start),
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+        )
+        self._sample(name, end - start)
+
+    def flush(self, name):
+        """Emit the phase totals and counts since the last flush under `name`."""
+        if not self.enabled or not (self.phases or self.counts):
+            return
+        now = self._micros(time.perf_counter())
+        if self.phases:
+            self.events.append(
+                {
+                    "name": f"{name} phases (ms)",
+                    "ph": "C",
+                    "ts": now,
+                    "pid": os.getpid(),
+                    "args": {
+                        phase: seconds * 1e3 for phase, seconds in self.phases.items()
+                    },
+                }
+            )
+            for phase, seconds in self.phases.items():
+                self._sample(f"{name}.{phase}", seconds)
+        if self.counts:
+            self.events.append(
+                {
+                    "name": f"{name} counts",
+                    "ph": "C",
+                    "ts": now,
+                    "pid": os.getpid(),
+                    "args": dict(self.counts),
+                }
+            )
+        self.phases = {}
+        self.counts = {}
+
+    def last(self, name):
+        """Seconds of the latest sample of `name`, or None."""
+        samples = self.recent.get(name)
+        return samples[-1] if samples else None
+
+    def summary(self):
+        """name: count, mean, max and last milliseconds over the rolling window."""
+        return {
+            name: {
+                "count": len(samples),
+                "mean_ms": sum(samples) / len(samples) * 1e3,
+                "max_ms": max(samples) * 1e3,
+                "last_ms": samples[-1] * 1e3,
+            }
+            for name, samples in sorted(self.recent.items())
+            if samples
+        }
+
+    def format_summary(self):
+        lines = [f"{'name':<40} {'count':>6} {'mean ms':>9} {'max ms':>9}"]
+        for name, row in self.summary().items():
+            lines.append(
+                f"{name:<40} {row['count']:>6} {row['mean_ms']:>9.3f}"
+                + f" {row['max_ms']:>9.3f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        return {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+
+    def save_trace(self, path):
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+
+    def _micros(self, seconds):
+        return (seconds - self._origin) * 1e6
+
+    def _sample(self, name, seconds):
+        samples = self.recent.get(name)
+        if samples is None:
+            samples = self.recent[name] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+
+
+# the profiler everything reports to
+PROFILER = Profiler()
+
+
+def _save_on_exit(path):
+    PROFILER.save_trace(path)
+    # stdout may be carrying output, such as cli.py's CSV
+    print(PROFILER.format_summary(), file=sys.stderr)
+
+
+# COOTIE_PROFILE=trace.json profiles the whole run and writes the trace on exit
+if os.environ.get("COOTIE_PROFILE"):
+    PROFILER.enable()
+    atexit.register(_save_on_exit, os.environ["COOTIE_PROFILE"])
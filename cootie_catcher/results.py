@@ -0,0 +1,225 @@
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+import numpy as np
+from store import COMPARTMENTS
+
+DEFAULT_MAX_BYTES = 1 << 30
+MAX_DEFAULT_SLOTS = 64
+
+FREE, CLAIMED, DONE = 0, 1, 2
+
+# blocks attached by this worker process, by name
+_attached = {}
+
+
+class ResultStore:
+    """Per-day compartment arrays of many runs, in one shared memory block.
+
+    The block holds `slots` trajectories of up to `days` + 1 days (day 0
+    included) of every compartment of `place_count` places, as int32.
+    Worker processes write days straight into a slot with `SlotWriter`,
+    and the parent reads a slot with `trajectory`, a NumPy view of the
+    block, so nothing is pickled or copied.
+
+    The total size is capped at `max_bytes`; by default as many slots are
+    made as fit under the cap. Slots are handed out with `claim` and given
+    back with `release`. The parent owns the block and unlinks it on
+    `close`, or when the store is garbage collected or the process exits,
+    so a crashed worker leaks nothing.
+    """
+
+    def __init__(self, days, place_count, slots=None, max_bytes=DEFAULT_MAX_BYTES):
+        slot_bytes = (days + 1) * len(COMPARTMENTS) * place_count * 4
+        fitting = max_bytes // slot_bytes
+        if slots is None:
+            slots = min(fitting, MAX_DEFAULT_SLOTS)
+        if slots < 1 or slots > fitting:
+            raise ValueError(
+                f"{max(slots, 1)} slots of {slot_bytes} bytes exceed the "
+                + f"{max_bytes} byte cap, use fewer slots or days"
+            )
+        self.days = days
+        self.place_count = place_count
+        self.slots = slots
+        self.layout = _layout(slots, days, place_count)
+        size = sum(_nbytes(shape, dtype) for _, shape, dtype in self.layout.values())
+        self.block = shared_memory.SharedMemory(create=True, size=size)
+        self._finalizer = weakref.finalize(self, _unlink, self.block)
+        arrays = _views(self.block.buf, self.layout)
+        self.data = arrays["data"]
+        self.lengths = arrays["lengths"]
+        self.states = arrays["states"]
+        self.states[:] = FREE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def spec(self):
+        """What a worker needs to attach, see `SlotWriter`."""
+        return self.block.name, self.layout
+
+    def claim(self):
+        """Reserve a free slot and return its index, or None if all are taken."""
+        free = np.flatnonzero(self.states == FREE)
+        if free.size == 0:
+            return None
+        slot = int(free[0])
+        self.states[slot] = CLAIMED
+        self.lengths[slot] = 0
+        return slot
+
+    def release(self, slot):
+        """Give a slot back; views of it are overwritten by its next run."""
+        self.states[slot] = FREE
+
+    def trajectory(self, slot):
+        """(days, compartments, places) view of the days written to a slot."""
+        return self.data[slot, : self.lengths[slot]]
+
+    def total(self, slot, compartment):
+        """Per-day totals over all places of one compartment of a slot."""
+        return self.trajectory(slot)[:, COMPARTMENTS.index(compartment)].sum(
+            axis=-1, dtype=np.int64
+        )
+
+    def run(
+        self,
+        runs,
+        days=None,
+        seed=None,
+        params=None,
+        engine="python",
+        all_days=False,
+        processes=None,
+    ):
+        """Simulate `runs` games in a process pool, yielding (run, trajectory).
+
+        Runs use the seeds "<seed>-<run>" as in cli.py and stop when won or
+        lost unless `all_days` is set. Results come in completion order; a
+        trajectory is a view that stays valid until the next one is
+        requested, after which its slot is reused. At most `slots` runs are
+        in flight. If a worker raises or dies, the slots of the runs in
+        flight are released and the error is raised.
+        """
+        days = self.days if days is None else min(days, self.days)
+        pending = {}
+        next_run = 0
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            try:
+                while next_run < runs or pending:
+                    while next_run < runs:
+                        slot = self.claim()
+                        if slot is None:
+                            break
+                        run_seed = None if seed is None else f"{seed}-{next_run}"
+                        future = pool.submit(
+                            _simulate_into,
+                            self.spec,
+                            slot,
+                            run_seed,
+                            days,
+                            params,
+                            engine,
+                            all_days,
+                        )
+                        pending[future] = (next_run, slot)
+                        next_run += 1
+
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        run_idx, slot = pending.pop(future)
+                        try:
+                            future.result()
+                            self.states[slot] = DONE
+                            yield run_idx, self.trajectory(slot)
+                        finally:
+                            self.release(slot)
+            finally:
+                for future, (_, slot) in pending.items():
+                    future.cancel()
+                    self.release(slot)
+
+    def close(self):
+        self.data = self.lengths = self.states = None
+        self._finalizer()
+
+
+class SlotWriter:
+    """Writes a run's days into one slot of a `ResultStore` from any process."""
+
+    def __init__(self, spec, slot):
+        name, layout = spec
+        if name not in _attached:
+            block = shared_memory.SharedMemory(name=name)
+            _attached[name] = (block, _views(block.buf, layout))
+        arrays = _attached[name][1]
+        self.data = arrays["data"][slot]
+        self.lengths = arrays["lengths"]
+        self.slot = slot
+
+    def write(self, day, store):
+        """Copy every compartment of a `PlaceStore` in as day index `day`."""
+        row = self.data[day]
+        for idx, name in enumerate(COMPARTMENTS):
+            row[idx] = np.frombuffer(getattr(store, name), dtype=np.int32)
+        self.lengths[self.slot] = max(self.lengths[self.slot], day + 1)
+
+
+def _simulate_into(spec, slot, seed, days, params, engine, all_days):
+    from params import Params
+    from sim import Pandemic
+
+    params = params if params is not None else Params.from_consts()
+    writer = SlotWriter(spec, slot)
+    pandemic = Pandemic(engine=engine, seed=seed, params=params)
+    writer.write(0, pandemic.store)
+    while pandemic.day < days:
+        pandemic.update()
+        writer.write(pandemic.day, pandemic.store)
+        if not all_days and (
+            pandemic.days_since_last_infection >= params.win_threshold
+            or pandemic.pct_dead >= params.lose_threshold
+        ):
+            break
+    return pandemic.day
+
+
+def _layout(slots, days, place_count):
+    # name: (offset, shape, dtype) of each array in the block
+    shapes = {
+        "data": ((slots, days + 1, len(COMPARTMENTS), place_count), "<i4"),
+        "lengths": ((slots,), "<i8"),
+        "states": ((slots,), "|u1"),
+    }
+    layout = {}
+    offset = 0
+    for name, (shape, dtype) in shapes.items():
+        layout[name] = (offset, shape, dtype)
+        offset += _nbytes(shape, dtype)
+    return layout
+
+
+def _nbytes(shape, dtype):
+    # rounded up so every array stays 8-byte aligned
+    return -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+
+
+def _views(buffer, layout):
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        for name, (offset, shape, dtype) in layout.items()
+    }
+
+
+def _unlink(block):
+    try:
+        block.close()
+    except BufferError:
+        # views are still alive, the mapping goes with the process
+        pass
+    block.unlink()
@@ -0,0 +1,251 @@
+import math
+import random
+
+# n * min(p, 1 - p) above which BTPE is used instead of inversion
+INVERSION_CUTOFF = 30.0
+
+
+def binomial(n, p, uniform=random.random):
+    """Generate a sample from a binomial distribution in O(1) expected time.
+
+    Uses inversion for small means and BTPE (Kachitvichyanukul & Schmeiser,
+    1988) otherwise, with the same switchover as NumPy. `uniform` is a
+    zero-argument callable returning floats in [0, 1). No uniforms are
+    consumed when the result is certain (n == 0, p == 0 or p == 1).
+    """
+    if n <= 0 or p <= 0:
+        return 0
+    if p >= 1:
+        return n
+    if p <= 0.5:
+        if n * p <= INVERSION_CUTOFF:
+            return _inversion(n, p, uniform)
+        return _btpe(n, p, uniform)
+    q = 1.0 - p
+    if n * q <= INVERSION_CUTOFF:
+        return n - _inversion(n, q, uniform)
+    return n - _btpe(n, q, uniform)
+
+
+def mean_field(binomial, threshold):
+    """Wrap `binomial(n, p, transition)` to skip sampling of large counts.
+
+    Draws with n * min(p, 1 - p) >= `threshold`, expecting many kids both
+    to move and to stay, return the expected count n * p, rounded half to
+    even, and consume no randomness. The others, where chance matters even
+    in a large compartment with a small p, are passed on to `binomial`.
+    """
+
+    def draw(n, p, transition=None):
+        p_ = min(max(p, 0.0), 1.0)
+        if n * min(p_, 1.0 - p_) >= threshold:
+            return round(n * p_)
+        return binomial(n, p, transition)
+
+    return draw
+
+
+def _inversion(n, p, uniform):
+    q = 1.0 - p
+    qn = math.exp(n * math.log(q))
+    np_ = n * p
+    bound = int(min(n, np_ + 10.0 * math.sqrt(np_ * q + 1)))
+
+    x = 0
+    px = qn
+    u = uniform()
+    while u > px:
+        x += 1
+        if x > bound:
+            x = 0
+            px = qn
+            u = uniform()
+        else:
+            u -= px
+            px = ((n - x + 1) * p * px) / (x * q)
+    return x
+
+
+def _stirling_correction(x):
+    x2 = x * x
+    return (
+        (13680.0 - (462.0 - (132.0 - (99.0 - 140.0 / x2) / x2) / x2) / x2)
+        / x
+        / 166320.0
+    )
+
+
+def _btpe(n, p, uniform):
+    # setup, p <= 0.5 here
+    q = 1.0 - p
+    fm = n * p + p
+    m = int(math.floor(fm))
+    nrq = n * p * q
+    p1 = math.floor(2.195 * math.sqrt(nrq) - 4.6 * q) + 0.5
+    xm = m + 0.5
+    xl = xm - p1
+    xr = xm + p1
+    c = 0.134 + 20.5 / (15.3 + m)
+    a = (fm - xl) / (fm - xl * p)
+    laml = a * (1.0 + a / 2.0)
+    a = (xr - fm) / (xr * q)
+    lamr = a * (1.0 + a / 2.0)
+    p2 = p1 * (1.0 + 2.0 * c)
+    p3 = p2 + c / laml
+    p4 = p3 + c / lamr
+
+    while True:
+        u = uniform() * p4
+        v = uniform()
+
+        # triangular region, accept immediately
+        if u <= p1:
+            return int(math.floor(xm - p1 * v + u))
+
+        if u <= p2:
+            # parallelogram region
+            x = xl + (u - p1) / c
+            v = v * c + 1.0 - abs(m - x + 0.5) / p1
+            if v > 1.0:
+                continue
+            y = int(math.floor(x))
+        elif u <= p3:
+            # left exponential tail
+            if v == 0.0:
+                continue
+            y = int(math.floor(xl + math.log(v) / laml))
+            if y < 0:
+                continue
+            v = v * (u - p2) * laml
+        else:
+            # right exponential tail
+            if v == 0.0:
+                continue
+            y = int(math.floor(xr - math.log(v) / lamr))
+            if y > n:
+                continue
+            v = v * (u - p3) * lamr
+
+        k = abs(y - m)
+        if k <= 20 or k >= nrq / 2.0 - 1:
+            # explicit evaluation of f(y) / f(m)
+            s = p / q
+            a = s * (n + 1)
+            f = 1.0
+            if m < y:
+                for i in range(m + 1, y + 1):
+                    f *= a / i - s
+            elif m > y:
+                for i in range(y + 1, m + 1):
+                    f /= a / i - s
+            if v <= f:
+                return y
+            continue
+
+        # squeeze using upper and lower bounds on log(f(y))
+        rho = (k / nrq) * ((k * (k / 3.0 + 0.625) + 0.16666666666666666) / nrq + 0.5)
+        t = -k * k / (2 * nrq)
+        alpha = math.log(v) if v > 0 else -math.inf
+        if alpha < t - rho:
+            return y
+        if alpha > t + rho:
+            continue
+
+        x1 = y + 1
+        f1 = m + 1
+        z = n + 1 - m
+        w = n - y + 1
+        bound = (
+            xm * math.log(f1 / x1)
+            + (n - m + 0.5) * math.log(z / w)
+            + (y - m) * math.log(w * p / (x1 * q))
+            + _stirling_correction(f1)
+            + _stirling_correction(z)
+            + _stirling_correction(x1)
+            + _stirling_correction(w)
+        )
+        if alpha <= bound:
+            return y
+
+
+class Sampler:
+    """Explicitly seeded source of random draws for the simulation."""
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self._generator = None
+
+    def uniform(self):
+        return self.random.random()
+
+    def binomial(self, n, p, transition=None):
+        # draws are sequential, the transition is only used by counter streams
+        return binomial(n, p, self.random.random)
+
+    def binomials(self, ns, ps):
+        """Draw one binomial sample for each (n, p) pair."""
+        uniform = self.random.random
+        return [binomial(n, p, uniform) for n, p in zip(ns, ps)]
+
+    def choice(self, seq):
+        return self.random.choice(seq)
+
+    def sample(self, population, k):
+        return self.random.sample(population, k)
+
+    @property
+    def generator(self):
+        """NumPy generator seeded from this sampler, for vectorized engines."""
+        if self._generator is None:
+            import numpy as np
+
+            self._generator = np.random.default_rng(self.random.getrandbits(128))
+        return self._generator
+
+    def getstate(self):
+        """State of the `random.Random` and, once created, of the generator."""
+        generator_state = (
+            self._generator.bit_generator.state if self._generator is not None else None
+        )
+        return self.random.getstate(), generator_state
+
+    def setstate(self, state):
+        random_state, generator_state = state
+        if generator_state is not None:
+            # set the existing generator in place, engines hold a reference
+            if self._generator is None:
+                import numpy as np
+
+                self._generator = np.random.default_rng()
+            self._generator.bit_generator.state = generator_state
+        self.random.setstate(random_state)
+
+    def copy(self):
+        """Sampler that continues with the same draws as this one."""
+        clone = Sampler.__new__(Sampler)
+        clone.seed = self.seed
+        clone.random = random.Random()
+        clone._generator = None
+        clone.setstate(self.getstate())
+        return clone
+
+
+if __name__ == "__main__":
+    # compare against the per-individual sampler this replaces
+    def reference(n, p, uniform):
+        return sum(1 for _ in range(n) if uniform() < p)
+
+    draws = 20000
+    rng = random.Random(0)
+    for n, p in [(5, 0.3), (50, 0.1), (100, 0.5), (400, 0.2), (1000, 0.95)]:
+        fast = [binomial(n, p, rng.random) for _ in range(draws)]
+        slow = [reference(n, p, rng.random) for _ in range(draws)]
+        for name, xs in (("fast", fast), ("reference", slow)):
+            mean = sum(xs) / draws
+            var = sum((x - mean) ** 2 for x in xs) / (draws - 1)
+            z = (mean - n * p) / math.sqrt(n * p * (1 - p) / draws)
+            print(
+                f"n={n} p={p} {name}: mean={mean:.3f} (z={z:+.2f})"
+                + f" var={var:.3f} expected={n * p * (1 - p):.3f}"
+            )
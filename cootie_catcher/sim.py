@@ -1,23 +1,43 @@
-import consts as c
+import copy
+from collections import deque
 from dataclasses import dataclass
-import random
-import networkx as nx
-
-
-def binomial(n, p):
-    """Generate a sample from a binomial distribution."""
-    successes = 0
-    for _ in range(n):
-        if random.random() < p:
-            successes += 1
-    return successes
-
-
-@dataclass
+from active import ActiveSet
+from network import Adjacency, barabasi_albert_network
+from params import Params
+from profiling import PROFILER
+from sampling import Sampler, binomial, mean_field
+from store import (
+    CONTACT_TRACING,
+    LOCKDOWN,
+    MASS_TESTING,
+    RESTRICT_TRAVEL,
+    TOTAL_NODE,
+    PlaceStore,
+    PlaceViews,
+    place_name,
+)
+from streams import (
+    INFECTED_TRAVELLERS,
+    NEW_DEAD_FROM_DETECTED,
+    NEW_DEAD_FROM_INFECTED,
+    NEW_DEAD_FROM_TREATED,
+    NEW_DETECTED,
+    NEW_EXPOSED,
+    NEW_INFECTED,
+    NEW_SUSCEPTIBLE_FROM_DETECTED,
+    NEW_SUSCEPTIBLE_FROM_INFECTED,
+    NEW_SUSCEPTIBLE_FROM_TREATED,
+    NEW_TREATED,
+    CounterStreams,
+)
+
+
+@dataclass(slots=True)
 class PlaceData:
+    """Standalone snapshot of one place, or of the totals over all places."""
+
     # metadata
     node: int
-    place_name: str
 
     # epidemic state
     susceptible: int
@@ -32,6 +52,10 @@ class PlaceData:
     anger: int = 0
     in_backlash: bool = False
 
+    @property
+    def place_name(self):
+        return place_name(self.node)
+
     def population(self):
         return (
             self.susceptible
@@ -53,154 +77,471 @@ class PlaceData:
 
 
 class Pandemic:
-    def __init__(self):
-        self.day = 0
-        self.action_budget = c.ACTION_BUDGET_BEGINNING
-        self.days_since_last_infection = 0
-        self.network = nx.barabasi_albert_graph(c.PLACE_COUNT, 2)
-        self.cities = {}
-        for place, place_name in zip(self.network.nodes, c.PLACE_NAMES):
-            # population = world population * node degree / (edge count * 2)
-            place_pop = (
-                c.TOTAL_POPULATION
-                * self.network.degree[place]
-                / (self.network.number_of_edges() * 2)
-            )
-
-            # Create a place data object for each place
-            self.cities[place_name] = PlaceData(
-                node=place,
-                place_name=place_name,
-                susceptible=int(place_pop),
-                exposed=0,
-                infected=0,
-                detected=0,
-                treated=0,
-                dead=0,
-                control_measures={
-                    "restrict_travel": False,
-                    "mass_testing": False,
-                    "contact_tracing": False,
-                    "lockdown": False,
-                },
-            )
+    engines = ("python", "numpy")
+
+    # the python engine only updates places that can change, see ActiveSet
+    skip_quiescent = True
+
+    def __init__(self, engine="python", seed=None, params=None, counter_rng=False):
+        rng = Sampler(seed)
+
+        # day-step draws from counter streams don't depend on update order
+        streams = None
+        if counter_rng:
+            stream_seed = seed if seed is not None else rng.random.getrandbits(64)
+            streams = CounterStreams(stream_seed)
+        p = params if params is not None else Params.from_consts()
+        network = barabasi_albert_network(p.place_count, 2, seed=rng.random)
+
+        # population = world population * node degree / (edge count * 2)
+        edge_count = network.number_of_edges()
+        degree = network.degree
+        store = PlaceStore(
+            [
+                int(p.total_population * degree[place] / (edge_count * 2))
+                for place in range(network.number_of_nodes())
+            ]
+        )
 
         # create patient(s) zero
-        random_place = random.choice(list(self.cities.values()))
+        random_place = rng.choice(PlaceViews(store))
         random_place.infected = 5
 
+        # only the CSR index is kept, the network is rebuilt if it is used
+        self._init_state(
+            engine,
+            rng,
+            streams,
+            p,
+            store,
+            adjacency=Adjacency(network).detach(),
+            day=0,
+            days_since_last_infection=0,
+            action_budget=p.action_budget_beginning,
+        )
+
+    @classmethod
+    def from_state(
+        cls,
+        engine,
+        rng,
+        streams,
+        params,
+        store,
+        adjacency,
+        day,
+        days_since_last_infection,
+        action_budget,
+    ):
+        """Game resuming from saved state, see snapshot.load.
+
+        The `Network` is only built from `adjacency` when first used.
+        """
+        pandemic = cls.__new__(cls)
+        pandemic._init_state(
+            engine,
+            rng,
+            streams,
+            params,
+            store,
+            adjacency=adjacency,
+            day=day,
+            days_since_last_infection=days_since_last_infection,
+            action_budget=action_budget,
+        )
+        return pandemic
+
+    def _init_state(
+        self,
+        engine,
+        rng,
+        streams,
+        params,
+        store,
+        network=None,
+        adjacency=None,
+        day=0,
+        days_since_last_infection=0,
+        action_budget=0,
+    ):
+        # every attribute of a game, shared by __init__ and from_state
+        if engine not in self.engines:
+            raise ValueError(
+                f"Unknown engine {engine!r}, expected one of {self.engines}"
+            )
+        self.engine = engine
+        self.rng = rng
+        self.streams = streams
+        self.params = params
+        self._network = network
+        self._adjacency = adjacency
+        self.day = day
+        self.days_since_last_infection = days_since_last_infection
+        self.action_budget = action_budget
+        self.store = store
+
+        # places are indexed by their node in the network
+        self.cities = PlaceViews(store)
+
+        self.history = None
+        self.undo_stack = None
+        self._active = None
+
+        # bumped whenever the state moves to another day, forwards or back,
+        # so caches of what is drawn can key on it
+        self.generation = 0
+
+        self.numpy_engine = None
+        if self.engine == "numpy":
+            from engine import NumpyEngine
+
+            self.numpy_engine = NumpyEngine(
+                params, rng=self.rng.generator, streams=self.streams
+            )
+
     def update(self):
+        with PROFILER.span("Pandemic.update"):
+            self._save_undo()
+
+            store = self.store
+            totals = store.totals
+            self._start_day(totals["infected"] + totals["exposed"] + totals["detected"])
+
+            if self.numpy_engine:
+                self.numpy_engine.update(store, self.adjacency, day=self.day)
+            elif self.skip_quiescent:
+                self._update_active_places()
+            else:
+                # neighbour contagion is read from the start-of-day counts
+                neighbour_contagious = self.adjacency.neighbour_sum(
+                    [i + e for i, e in zip(store.infected, store.exposed)]
+                )
+                for node in range(len(store)):
+                    self.update_place(node, neighbour_contagious[node])
+
+            store.check_totals()
+            self.generation += 1
+            self._record_history()
+        PROFILER.flush("Pandemic.update")
+
+    def _update_active_places(self):
+        # same result as updating every place, in time proportional to the
+        # outbreak and the places whose anger is moving
+        store = self.store
+        profile = PROFILER.enabled
+        if profile:
+            start = PROFILER.clock()
+        active = self._active
+        if active is None or not active.sync(self.day - 1, store):
+            active = self._active = ActiveSet.scan(store)
+            if profile:
+                PROFILER.count("active scans")
+        if profile:
+            start = PROFILER.lap("active set", start)
+
+        # neighbour contagion from the start-of-day counts, pushed out from
+        # the contagious places
+        contagion = {}
+        neighbours_of = self.adjacency.neighbours_of
+        for node in active.sick:
+            contagious = store.infected[node] + store.exposed[node]
+            if contagious:
+                for neighbour in neighbours_of(node):
+                    contagion[neighbour] = contagion.get(neighbour, 0) + contagious
+
+        # places are updated in node order, so sequential draws line up
+        epidemic = active.sick.union(contagion)
+        if profile:
+            PROFILER.lap("contagion", start)
+        for node in sorted(epidemic):
+            self.update_place(node, contagion.get(node, 0))
+
+        # elsewhere only anger moves
+        if profile:
+            start = PROFILER.clock()
+        angry = active.angry - epidemic
+        for node in angry:
+            if store.population[node] != store.dead[node]:
+                self.update_anger(node)
+        if profile:
+            start = PROFILER.lap("anger only", start)
+            PROFILER.count("anger only places", len(angry))
+
+        active.refresh(store, epidemic | angry)
+        active.mark(self.day, store)
+        if profile:
+            PROFILER.lap("active set", start)
+
+    def _start_day(self, total_infections):
+        p = self.params
         self.day += 1
 
         # update days since last infection
-        total_infections = 0
-        for place_data in self.cities.values():
-            total_infections += (
-                place_data.infected + place_data.exposed + place_data.detected
-            )
-
         if total_infections > 0:
             self.days_since_last_infection = 0
         else:
             self.days_since_last_infection += 1
 
         # update action budget
-        if self.day < c.MIDDLE_CUTOFF:
-            self.action_budget = c.ACTION_BUDGET_BEGINNING
-        elif self.day < c.END_CUTOFF:
-            self.action_budget = c.ACTION_BUDGET_MIDDLE
+        if self.day < p.middle_cutoff:
+            self.action_budget = p.action_budget_beginning
+        elif self.day < p.end_cutoff:
+            self.action_budget = p.action_budget_middle
         else:
-            self.action_budget = c.ACTION_BUDGET_END
+            self.action_budget = p.action_budget_end
 
-        for place in self.cities.values():
-            self.update_place(place)
+    def commit(self, stepped):
+        """Publish a fork of this game that was advanced by one `update`.
 
-    def update_place(self, place):
-        if place.alive() == 0:
-            return
+        Lets the day be stepped elsewhere, e.g. in a worker thread, while
+        this game stays readable; the result is the same as calling
+        `update` here.
+        """
+        self._save_undo()
+        self.restore(stepped)
+        self._record_history()
+
+    def _save_undo(self):
+        if self.undo_stack is not None:
+            history_count = self.history.count if self.history is not None else None
+            self.undo_stack.append((self.fork(), history_count))
+
+    def _record_history(self):
+        if self.history is not None:
+            self.history.record(self.day, self.store)
+
+    def track_history(self, capacity=1000, every=1):
+        """Start recording every day's state into a `History`."""
+        from history import History
 
-        # update backlash
-        if place.control_measures["lockdown"]:
-            place.anger += 1
-        elif place.anger > 0:
-            place.anger -= 1
+        self.history = History(len(self.store), capacity=capacity, every=every)
+        self.history.record(self.day, self.store)
+        return self.history
 
-        if place.anger == 0 and place.in_backlash:
-            place.in_backlash = False
+    @property
+    def network(self):
+        """The place network, rebuilt from the adjacency index when first used."""
+        if self._network is None:
+            self._network = self._adjacency.to_network()
+        return self._network
+
+    @network.setter
+    def network(self, network):
+        self._network = network
+        self._adjacency = None
+
+    def save(self, path):
+        """Write the full state to a .npz snapshot, see snapshot.py."""
+        from snapshot import save
+
+        save(self, path)
+
+    @classmethod
+    def load(cls, path):
+        """Restore a game saved with `save`, resuming bit-identically."""
+        from snapshot import load
+
+        return load(path)
+
+    def fork(self):
+        """Independent copy of the game that shares the network.
+
+        The copy has its own place store and random state, and carries on
+        exactly as this game would until either of them is changed. It
+        records no history or undo steps.
+        """
+        clone = copy.copy(self)
+        clone.store = self.store.copy()
+        clone.cities = PlaceViews(clone.store)
+        clone.rng = self.rng.copy()
+        clone.history = None
+        clone.undo_stack = None
+        clone._active = self._active.copy() if self._active is not None else None
+        if self.numpy_engine is not None:
+            from engine import NumpyEngine
+
+            clone.numpy_engine = NumpyEngine(
+                self.params, rng=clone.rng.generator, streams=self.streams
+            )
+        return clone
+
+    def restore(self, fork):
+        """Return this game, in place, to the state of one of its forks."""
+        self.store.assign(fork.store)
+        self._active = fork._active.copy() if fork._active is not None else None
+        self.rng.setstate(fork.rng.getstate())
+        self.day = fork.day
+        self.days_since_last_infection = fork.days_since_last_infection
+        self.action_budget = fork.action_budget
+        self.generation += 1
+
+    def track_undo(self, limit=20):
+        """Keep a fork from before each of the last `limit` days for `undo`."""
+        self.undo_stack = deque(maxlen=limit)
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def undo(self):
+        """Go back to the start of the last day played."""
+        fork, history_count = self.undo_stack.pop()
+        self.restore(fork)
+        if self.history is not None and history_count is not None:
+            self.history.rewind(history_count)
+
+    def check_totals(self):
+        """Compare the running totals against a full recount of every place."""
+        self.store.check_totals(full=True)
 
-        if place.anger == c.ANGER_THRESHOLD:
-            for measure in place.control_measures:
-                place.control_measures[measure] = False
-                place.in_backlash = True
+    @property
+    def adjacency(self):
+        """CSR neighbour index, rebuilt when the network is replaced or mutated."""
+        if self._network is None:
+            return self._adjacency
+        if self._adjacency is None or not self._adjacency.is_current(self.network):
+            self._adjacency = Adjacency(self.network)
+        return self._adjacency
+
+    def update_anger(self, node):
+        """Advance the anger and backlash of one living place by a day.
+
+        Returns the control measures left in place.
+        """
+        store = self.store
+        measures = store.measures[node]
+        anger = store.anger[node]
+        if measures & LOCKDOWN:
+            anger += 1
+        elif anger > 0:
+            anger -= 1
+
+        if anger == 0 and store.in_backlash[node]:
+            store.in_backlash[node] = False
+
+        if anger == self.params.anger_threshold:
+            measures = 0
+            store.clear_measures(node)
+            store.in_backlash[node] = True
+        store.anger[node] = anger
+        return measures
+
+    def update_place(self, node, neighbour_contagious=None):
+        p = self.params
+        store = self.store
+        if self.streams is not None:
+            binomial = self.streams.place_binomial(self.day, node)
+        else:
+            binomial = self.rng.binomial
+        if p.mean_field_threshold:
+            binomial = mean_field(binomial, p.mean_field_threshold)
+
+        susceptible = store.susceptible[node]
+        exposed = store.exposed[node]
+        infected = store.infected[node]
+        detected = store.detected[node]
+        treated = store.treated[node]
+        population = store.population[node]
+        alive = population - store.dead[node]
+        if alive == 0:
+            return
+
+        # phase timings, see profiling.py
+        profile = PROFILER.enabled
+        if profile:
+            PROFILER.count("places")
+            start = PROFILER.clock()
+
+        measures = self.update_anger(node)
+        if profile:
+            start = PROFILER.lap("backlash", start)
 
         # calculate deltas
 
         # new disease
 
         # get infections in neighbours
-        neighbour_contagious = 0
-        for neighbour in self.network.neighbors(place.node):
-            neighbour = self.cities[c.PLACE_NAMES[neighbour]]
-            neighbour_contagious += neighbour.infected + neighbour.exposed
+        if neighbour_contagious is None:
+            neighbour_contagious = 0
+            for neighbour in self.adjacency.neighbours_of(node):
+                neighbour_contagious += (
+                    store.infected[neighbour] + store.exposed[neighbour]
+                )
+            if profile:
+                start = PROFILER.lap("neighbours", start)
 
         # calculate infected travellers as a proportion of infected in neighbours
         travel_rate = (
-            c.TRAVEL_RATE
-            if not place.control_measures["restrict_travel"]
-            and not place.control_measures["lockdown"]
-            else 0
+            p.travel_rate if not measures & (RESTRICT_TRAVEL | LOCKDOWN) else 0
+        )
+        infected_travellers = binomial(
+            neighbour_contagious, travel_rate, INFECTED_TRAVELLERS
         )
-        infected_travellers = binomial(neighbour_contagious, travel_rate)
 
         # calculate number of people spreading
-        total_infections = place.infected + infected_travellers
-        total_spreading = total_infections + place.exposed
-        if place.control_measures["contact_tracing"]:
-            total_spreading -= min(c.CONTACT_TRACING_CAPACITY, total_spreading)
+        total_infections = infected + infected_travellers
+        total_spreading = total_infections + exposed
+        if measures & CONTACT_TRACING:
+            total_spreading -= min(p.contact_tracing_capacity, total_spreading)
 
         infection_risk_per_contact = (
-            c.INFECTION_RATE * total_spreading / (place.alive() + infected_travellers)
+            p.infection_rate * total_spreading / (alive + infected_travellers)
         )
-        contacts = c.CONTACTS if not place.control_measures["lockdown"] else 0
+        contacts = p.contacts if not measures & LOCKDOWN else 0
         infection_risk = 1 - (1 - infection_risk_per_contact) ** (contacts)
 
-        new_exposed = binomial(place.susceptible, infection_risk)
+        new_exposed = binomial(susceptible, infection_risk, NEW_EXPOSED)
+        if profile:
+            start = PROFILER.lap("exposure", start)
 
         # symptomatic deltas
-        new_infected = binomial(place.exposed, c.INCUBATION_RATE)
+        new_infected = binomial(exposed, p.incubation_rate, NEW_INFECTED)
         detection_rate = (
-            c.DETECTION_RATE
-            if not place.control_measures["mass_testing"]
-            else c.MASS_TESTING_DETECTION_RATE
+            p.detection_rate
+            if not measures & MASS_TESTING
+            else p.mass_testing_detection_rate
         )
-        new_detected = binomial(place.infected, detection_rate)
+        new_detected = binomial(infected, detection_rate, NEW_DETECTED)
         new_dead_from_infected = binomial(
-            place.infected - new_detected, c.MORTALITY_RATE
+            infected - new_detected, p.mortality_rate, NEW_DEAD_FROM_INFECTED
         )
         new_susceptible_from_infected = binomial(
-            place.infected - new_detected - new_dead_from_infected, c.RECOVERY_RATE
+            infected - new_detected - new_dead_from_infected,
+            p.recovery_rate,
+            NEW_SUSCEPTIBLE_FROM_INFECTED,
         )
+        if profile:
+            start = PROFILER.lap("symptomatic", start)
 
         # detected deltas
         new_treated = int(
             min(
-                binomial(place.detected, c.TREATMENT_RATE),
-                place.population() * c.TREATMENT_CAPACITY,
+                binomial(detected, p.treatment_rate, NEW_TREATED),
+                population * p.treatment_capacity,
             )
         )
         new_dead_from_detected = binomial(
-            place.detected - new_treated, c.MORTALITY_RATE
+            detected - new_treated, p.mortality_rate, NEW_DEAD_FROM_DETECTED
         )
         new_susceptible_from_detected = binomial(
-            place.detected - new_treated - new_dead_from_detected,
-            c.RECOVERY_RATE,
+            detected - new_treated - new_dead_from_detected,
+            p.recovery_rate,
+            NEW_SUSCEPTIBLE_FROM_DETECTED,
         )
+        if profile:
+            start = PROFILER.lap("detected", start)
 
         # treated deltas
-        new_dead_from_treated = binomial(place.treated, c.MORTALITY_RATE * 0.1)
+        new_dead_from_treated = binomial(
+            treated, p.mortality_rate * 0.1, NEW_DEAD_FROM_TREATED
+        )
         new_susceptible_from_treated = binomial(
-            place.treated - new_dead_from_treated, c.RECOVERY_RATE * 5
+            treated - new_dead_from_treated,
+            p.recovery_rate * 5,
+            NEW_SUSCEPTIBLE_FROM_TREATED,
         )
+        if profile:
+            start = PROFILER.lap("treated", start)
 
         # totals
         new_dead_total = (
@@ -212,58 +553,45 @@ class Pandemic:
             + new_susceptible_from_treated
         )
 
-        # update place data
-        place.susceptible = place.susceptible - new_exposed + new_susceptible_total
-        place.exposed = place.exposed + new_exposed - new_infected
-        place.infected = (
-            place.infected
-            + new_infected
+        # compartment deltas, the population is unchanged
+        delta_susceptible = new_susceptible_total - new_exposed
+        delta_exposed = new_exposed - new_infected
+        delta_infected = (
+            new_infected
             - new_detected
             - new_dead_from_infected
             - new_susceptible_from_infected
         )
-        place.detected = (
-            place.detected
-            + new_detected
+        delta_detected = (
+            new_detected
             - new_treated
             - new_dead_from_detected
             - new_susceptible_from_detected
         )
-        place.treated = (
-            place.treated
-            + new_treated
-            - new_dead_from_treated
-            - new_susceptible_from_treated
+        delta_treated = (
+            new_treated - new_dead_from_treated - new_susceptible_from_treated
         )
-        place.dead = place.dead + new_dead_total
+
+        # update place data and the running totals
+        store.susceptible[node] = susceptible + delta_susceptible
+        store.exposed[node] = exposed + delta_exposed
+        store.infected[node] = infected + delta_infected
+        store.detected[node] = detected + delta_detected
+        store.treated[node] = treated + delta_treated
+        store.dead[node] += new_dead_total
+
+        totals = store.totals
+        totals["susceptible"] += delta_susceptible
+        totals["exposed"] += delta_exposed
+        totals["infected"] += delta_infected
+        totals["detected"] += delta_detected
+        totals["treated"] += delta_treated
+        totals["dead"] += new_dead_total
+        if profile:
+            PROFILER.lap("apply", start)
 
     def get_totals(self):
-        total_susceptible = 0
-        total_exposed = 0
-        total_infected = 0
-        total_detected = 0
-        total_treated = 0
-        total_dead = 0
-
-        for place in self.cities.values():
-            total_susceptible += place.susceptible
-            total_exposed += place.exposed
-            total_infected += place.infected
-            total_detected += place.detected
-            total_treated += place.treated
-            total_dead += place.dead
-
-        return PlaceData(
-            node=-1,
-            place_name="Total",
-            susceptible=total_susceptible,
-            exposed=total_exposed,
-            infected=total_infected,
-            detected=total_detected,
-            treated=total_treated,
-            dead=total_dead,
-            control_measures=None,
-        )
+        return PlaceData(node=TOTAL_NODE, control_measures=None, **self.store.totals)
 
     def __str__(self):
         totals = self.get_totals()
@@ -278,41 +606,56 @@ class Pandemic:
 
     def randomize_actions(self, action_name, n):
         # get cities that are not in backlash
-        non_backlash_cities = [
-            place for place in self.cities.values() if not place.in_backlash
-        ]
+        non_backlash_cities = [place for place in self.cities if not place.in_backlash]
 
         # Randomly select n places to apply the action to
-        places = random.sample(non_backlash_cities, n)
+        places = self.rng.sample(non_backlash_cities, n)
 
         # deselect all actions for the selected action type
-        for place in self.cities.values():
-            place.control_measures[action_name] = False
+        self.clear_measure(action_name)
 
         # Apply the action to the selected places
         for place in places:
-            place.control_measures[action_name] = True  # Apply the action
+            self.set_measure(place.node, action_name, True)  # Apply the action
+
+    def has_measure(self, node, action_name):
+        return self.store.has_measure(node, action_name)
+
+    def set_measure(self, node, action_name, value):
+        """Turn a control measure on or off at one place."""
+        self.store.set_measure(node, action_name, value)
+
+    def clear_measure(self, action_name):
+        """Turn a control measure off at every place."""
+        self.store.clear_measure(action_name)
+
+    def measure_count(self, action_name):
+        """Number of places where a control measure is on."""
+        return self.store.measure_counts[action_name]
 
     @property
     def action_count(self):
-        action_count = 0
-        for place in self.cities.values():
-            action_count += sum(place.control_measures.values())
-        return action_count
+        return self.store.measure_total
+
+    @property
+    def actions_left(self):
+        return self.action_budget - self.action_count
 
     @property
     def pct_dead(self):
-        totals = self.get_totals()
-        return int((1 - totals.alive() / totals.population()) * 100)
+        store = self.store
+        return int((1 - store.total_alive / store.total_population) * 100)
 
 
 if __name__ == "__main__":
 
     p = Pandemic()
 
-    place_populations = [place.population() for place in p.cities.values()]
+    place_populations = [place.population() for place in p.cities]
 
     day = 0
     while p.get_totals().susceptible > 0 and day < 1000:
         p.update()
         day += 1
+
+    p.check_totals()
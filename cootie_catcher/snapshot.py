@@ -0,0 +1,95 @@
+import json
+from dataclasses import asdict
+import numpy as np
+from network import Adjacency
+from params import Params
+from sampling import Sampler
+from sim import Pandemic
+from streams import CounterStreams
+from store import PlaceStore
+
+FORMAT_VERSION = 1
+
+
+def save(pandemic, path):
+    """Write the full state of `pandemic` to an uncompressed .npz file.
+
+    The network is stored as its CSR adjacency arrays and the place store
+    as its raw field arrays, so saving copies bytes and nothing else.
+    History is not saved.
+    """
+    store = pandemic.store
+    adjacency = pandemic.adjacency
+    random_state, generator_state = pandemic.rng.getstate()
+    version, internal, gauss_next = random_state
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "engine": pandemic.engine,
+        "seed": pandemic.rng.seed,
+        "stream_seed": pandemic.streams.seed if pandemic.streams else None,
+        "params": asdict(pandemic.params),
+        "day": pandemic.day,
+        "days_since_last_infection": pandemic.days_since_last_infection,
+        "action_budget": pandemic.action_budget,
+        "totals": store.totals,
+        "measure_counts": store.measure_counts,
+        "random_version": version,
+        "random_gauss_next": gauss_next,
+        "generator_state": generator_state,
+    }
+    arrays = {
+        name: np.frombuffer(getattr(store, name), dtype=store.typecodes[name])
+        for name in store.fields
+    }
+    with open(path, "wb") as file:
+        np.savez(
+            file,
+            meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+            offsets=np.frombuffer(adjacency.offsets, dtype=np.int64),
+            neighbours=np.frombuffer(adjacency.neighbours, dtype=np.int64),
+            random_internal=np.array(internal, dtype=np.uint32),
+            **arrays,
+        )
+
+
+def load(path):
+    """Restore a `Pandemic` from a file written by `save`.
+
+    The `Network` is only built when `Pandemic.network` is first used;
+    simulating needs just the adjacency arrays.
+    """
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].tobytes())
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot format version {meta['format_version']}"
+            )
+        store = PlaceStore.from_arrays(
+            {name: data[name] for name in PlaceStore.fields},
+            totals=meta["totals"],
+            measure_counts=meta["measure_counts"],
+        )
+        adjacency = Adjacency.from_arrays(data["offsets"], data["neighbours"])
+        random_internal = tuple(data["random_internal"].tolist())
+
+    rng = Sampler(meta["seed"])
+    rng.setstate(
+        (
+            (meta["random_version"], random_internal, meta["random_gauss_next"]),
+            meta["generator_state"],
+        )
+    )
+    streams = None
+    if meta["stream_seed"] is not None:
+        streams = CounterStreams(meta["stream_seed"])
+    return Pandemic.from_state(
+        meta["engine"],
+        rng,
+        streams,
+        Params(**meta["params"]),
+        store,
+        adjacency,
+        day=meta["day"],
+        days_since_last_infection=meta["days_since_last_infection"],
+        action_budget=meta["action_budget"],
+    )
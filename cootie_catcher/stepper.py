@@ -0,0 +1,73 @@
+import threading
+
+
+class DayStepper:
+    """Advances a `Pandemic` by one day off the calling thread.
+
+    `start` steps a fork of the game in a worker thread, so the game itself
+    stays unchanged and readable. Call `poll` regularly from the thread
+    that owns the game; once the step has finished it publishes the fork
+    with `Pandemic.commit`. Only one day is in flight at a time. Where
+    threads cannot be started, as in Pyodide, `start` steps synchronously.
+    """
+
+    def __init__(self, sim, background=True):
+        self.sim = sim
+        self.background = background
+        self.day = None
+        self._thread = None
+        self._stepped = None
+        self._error = None
+
+    @property
+    def busy(self):
+        return self._thread is not None
+
+    def start(self):
+        """Begin stepping the next day, returns False if one is in flight."""
+        if self.busy:
+            return False
+
+        fork = self.sim.fork()
+        self.day = self.sim.day + 1
+        if self.background:
+            self._thread = threading.Thread(
+                target=self._step, args=(fork,), daemon=True
+            )
+            try:
+                self._thread.start()
+                return True
+            except RuntimeError:
+                self._thread = None
+                self.background = False
+
+        fork.update()
+        self.sim.commit(fork)
+        return True
+
+    def poll(self):
+        """Publish a finished step, returns True if the game changed."""
+        if self._thread is None or self._thread.is_alive():
+            return False
+
+        self._thread.join()
+        self._thread = None
+        stepped, error = self._stepped, self._error
+        self._stepped = self._error = None
+        if error is not None:
+            raise error
+        self.sim.commit(stepped)
+        return True
+
+    def wait(self):
+        """Block until the step in flight, if any, is published."""
+        if self._thread is not None:
+            self._thread.join()
+        return self.poll()
+
+    def _step(self, fork):
+        try:
+            fork.update()
+            self._stepped = fork
+        except BaseException as error:
+            self._error = error
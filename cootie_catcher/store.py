@@ -0,0 +1,305 @@
+from array import array
+from collections.abc import MutableMapping, Sequence
+import consts as c
+
+COMPARTMENTS = ("susceptible", "exposed", "infected", "detected", "treated", "dead")
+
+# control measures are packed into one byte per place
+MEASURE_BITS = {action: 1 << idx for idx, action in enumerate(c.ACTIONS)}
+RESTRICT_TRAVEL = MEASURE_BITS["restrict_travel"]
+MASS_TESTING = MEASURE_BITS["mass_testing"]
+CONTACT_TRACING = MEASURE_BITS["contact_tracing"]
+LOCKDOWN = MEASURE_BITS["lockdown"]
+
+TOTAL_NODE = -1
+
+
+def place_name(node):
+    """Return the name of the place with integer id `node`.
+
+    The first places use the names in consts.PLACE_NAMES, the rest are
+    numbered, so names never need to be stored per place.
+    """
+    if node == TOTAL_NODE:
+        return "Total"
+    if node < len(c.PLACE_NAMES):
+        return c.PLACE_NAMES[node]
+    return f"School #{node + 1}"
+
+
+class PlaceStore:
+    """State of every place in typed arrays, one array per field.
+
+    Compartments and population are 32-bit, so a place holds at most 2**31
+    people. A place costs 34 bytes: six compartments, the population, a
+    16-bit anger, a backlash flag and a control-measure bitmask. A
+    `Pandemic` adds its CSR neighbour index, about 40 bytes a place on the
+    default networks, for about 75 bytes a place in all; its `Network` is
+    only built when used. The population is kept up to date on every
+    write, so population and alive counts are single reads.
+
+    `totals` holds the sum of each compartment over all places and
+    `total_population` the sum of populations. Whoever writes the
+    compartment arrays also applies the same deltas to the totals, or
+    calls `recount` after a bulk update.
+
+    `measure_counts` holds the number of places with each control measure
+    and `measure_total` their sum. Control measures are only changed through
+    `set_measure` and `clear_measures`, which keep the counts in step.
+    """
+
+    fields = COMPARTMENTS + ("population", "anger", "in_backlash", "measures")
+    typecodes = {
+        **{name: "i" for name in COMPARTMENTS + ("population",)},
+        "anger": "h",
+        "in_backlash": "b",
+        "measures": "B",
+    }
+
+    def __init__(self, populations):
+        zeros = bytes(len(populations))
+        self.susceptible = array("i", populations)
+        self.exposed = array("i", zeros * 4)
+        self.infected = array("i", zeros * 4)
+        self.detected = array("i", zeros * 4)
+        self.treated = array("i", zeros * 4)
+        self.dead = array("i", zeros * 4)
+        self.population = array("i", populations)
+        self.anger = array("h", zeros * 2)
+        self.in_backlash = array("b", zeros)
+        self.measures = array("B", zeros)
+        self.recount()
+
+    @classmethod
+    def from_arrays(cls, arrays, totals=None, measure_counts=None):
+        """Store holding copies of the given field arrays, e.g. from a snapshot.
+
+        Running totals and measure counts are recounted unless given.
+        """
+        store = cls.__new__(cls)
+        for name in cls.fields:
+            values = array(cls.typecodes[name])
+            values.frombytes(memoryview(arrays[name]).cast("B"))
+            setattr(store, name, values)
+        if totals is None or measure_counts is None:
+            store.recount()
+        else:
+            store.totals = dict(totals)
+            store.total_population = sum(store.totals.values())
+            store.measure_counts = dict(measure_counts)
+            store.measure_total = sum(store.measure_counts.values())
+        return store
+
+    def copy(self):
+        return PlaceStore.from_arrays(
+            {name: getattr(self, name) for name in self.fields},
+            totals=self.totals,
+            measure_counts=self.measure_counts,
+        )
+
+    def assign(self, other):
+        """Copy the state of another store of the same size into this one.
+
+        The arrays are overwritten in place, so views of them stay valid.
+        """
+        for name in self.fields:
+            getattr(self, name)[:] = getattr(other, name)
+        self.totals = dict(other.totals)
+        self.total_population = other.total_population
+        self.measure_counts = dict(other.measure_counts)
+        self.measure_total = other.measure_total
+
+    def __len__(self):
+        return len(self.population)
+
+    def alive(self, node):
+        return self.population[node] - self.dead[node]
+
+    @property
+    def total_alive(self):
+        return self.total_population - self.totals["dead"]
+
+    def recount(self):
+        """Recompute the running totals and measure counts from the arrays."""
+        self.totals = {name: sum(getattr(self, name)) for name in COMPARTMENTS}
+        self.total_population = sum(self.population)
+        self.measure_counts = {
+            action: sum(1 for measures in self.measures if measures & bit)
+            for action, bit in MEASURE_BITS.items()
+        }
+        self.measure_total = sum(self.measure_counts.values())
+
+    def has_measure(self, node, action):
+        return bool(self.measures[node] & MEASURE_BITS[action])
+
+    def set_measure(self, node, action, value):
+        bit = MEASURE_BITS[action]
+        is_set = bool(self.measures[node] & bit)
+        if value and not is_set:
+            self.measures[node] |= bit
+            self.measure_counts[action] += 1
+            self.measure_total += 1
+        elif is_set and not value:
+            self.measures[node] &= ~bit
+            self.measure_counts[action] -= 1
+            self.measure_total -= 1
+
+    def clear_measures(self, node):
+        """Turn off every control measure at one place."""
+        measures = self.measures[node]
+        if not measures:
+            return
+        for action, bit in MEASURE_BITS.items():
+            if measures & bit:
+                self.measure_counts[action] -= 1
+                self.measure_total -= 1
+        self.measures[node] = 0
+
+    def clear_measure(self, action):
+        """Turn off one control measure at every place."""
+        bit = MEASURE_BITS[action]
+        measures = self.measures
+        node = 0
+        while self.measure_counts[action]:
+            if measures[node] & bit:
+                measures[node] &= ~bit
+                self.measure_counts[action] -= 1
+                self.measure_total -= 1
+            node += 1
+
+    def check_totals(self, full=False):
+        """Raise if the running totals have drifted from the arrays.
+
+        The default check is O(1): the totals must add up to the total
+        population. With `full`, every total and measure count is compared
+        with a recount.
+        """
+        if sum(self.totals.values()) != self.total_population:
+            raise RuntimeError(
+                f"Compartment totals {self.totals} do not add up to the total "
+                + f"population {self.total_population}"
+            )
+        if full:
+            totals, measure_counts = self.totals, self.measure_counts
+            self.recount()
+            if totals != self.totals or measure_counts != self.measure_counts:
+                raise RuntimeError(
+                    f"Running totals {totals} and measure counts {measure_counts}"
+                    + f" differ from recount {self.totals}, {self.measure_counts}"
+                )
+
+
+def _compartment(name):
+    def get(self):
+        return getattr(self.store, name)[self.node]
+
+    def set(self, value):
+        store = self.store
+        values = getattr(store, name)
+        delta = value - values[self.node]
+        values[self.node] = value
+        store.population[self.node] += delta
+        store.totals[name] += delta
+        store.total_population += delta
+
+    return property(get, set)
+
+
+class ControlMeasures(MutableMapping):
+    """Dict-like view of one place's control-measure bitmask."""
+
+    __slots__ = ("store", "node")
+
+    def __init__(self, store, node):
+        self.store = store
+        self.node = node
+
+    def __getitem__(self, action):
+        return self.store.has_measure(self.node, action)
+
+    def __setitem__(self, action, value):
+        self.store.set_measure(self.node, action, value)
+
+    def __delitem__(self, action):
+        raise TypeError("Control measures cannot be removed")
+
+    def __iter__(self):
+        return iter(MEASURE_BITS)
+
+    def __len__(self):
+        return len(MEASURE_BITS)
+
+
+class PlaceView:
+    """`PlaceData`-compatible view of one place in a `PlaceStore`."""
+
+    __slots__ = ("store", "node")
+
+    def __init__(self, store, node):
+        self.store = store
+        self.node = node
+
+    susceptible = _compartment("susceptible")
+    exposed = _compartment("exposed")
+    infected = _compartment("infected")
+    detected = _compartment("detected")
+    treated = _compartment("treated")
+    dead = _compartment("dead")
+
+    @property
+    def place_name(self):
+        return place_name(self.node)
+
+    @property
+    def anger(self):
+        return self.store.anger[self.node]
+
+    @anger.setter
+    def anger(self, value):
+        self.store.anger[self.node] = value
+
+    @property
+    def in_backlash(self):
+        return bool(self.store.in_backlash[self.node])
+
+    @in_backlash.setter
+    def in_backlash(self, value):
+        self.store.in_backlash[self.node] = value
+
+    @property
+    def measures(self):
+        return self.store.measures[self.node]
+
+    @property
+    def control_measures(self):
+        return ControlMeasures(self.store, self.node)
+
+    def population(self):
+        return self.store.population[self.node]
+
+    def alive(self):
+        return self.store.population[self.node] - self.store.dead[self.node]
+
+
+class PlaceViews(Sequence):
+    """Sequence of `PlaceView`s over a store, created on access."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, node):
+        if isinstance(node, slice):
+            return [PlaceView(self.store, i) for i in range(len(self))[node]]
+        if node < 0:
+            node += len(self)
+        if not 0 <= node < len(self):
+            raise IndexError("place index out of range")
+        return PlaceView(self.store, node)
+
+    def __iter__(self):
+        store = self.store
+        for node in range(len(store)):
+            yield PlaceView(store, node)
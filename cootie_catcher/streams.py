@@ -0,0 +1,411 @@
+import hashlib
+import math
+from sampling import INVERSION_CUTOFF, binomial
+
+# transitions drawn for each place and day, in the order update_place draws them
+TRANSITIONS = (
+    "infected_travellers",
+    "new_exposed",
+    "new_infected",
+    "new_detected",
+    "new_dead_from_infected",
+    "new_susceptible_from_infected",
+    "new_treated",
+    "new_dead_from_detected",
+    "new_susceptible_from_detected",
+    "new_dead_from_treated",
+    "new_susceptible_from_treated",
+)
+(
+    INFECTED_TRAVELLERS,
+    NEW_EXPOSED,
+    NEW_INFECTED,
+    NEW_DETECTED,
+    NEW_DEAD_FROM_INFECTED,
+    NEW_SUSCEPTIBLE_FROM_INFECTED,
+    NEW_TREATED,
+    NEW_DEAD_FROM_DETECTED,
+    NEW_SUSCEPTIBLE_FROM_DETECTED,
+    NEW_DEAD_FROM_TREATED,
+    NEW_SUSCEPTIBLE_FROM_TREATED,
+) = range(len(TRANSITIONS))
+
+# Philox-4x32-10 constants (Salmon et al., 2011)
+PHILOX_M0 = 0xD2511F53
+PHILOX_M1 = 0xCD9E8D57
+PHILOX_W0 = 0x9E3779B9
+PHILOX_W1 = 0xBB67AE85
+PHILOX_ROUNDS = 10
+MASK32 = 0xFFFFFFFF
+
+
+def philox(c0, c1, c2, c3, k0, k1):
+    """Philox-4x32-10 of one counter (c0, c1, c2, c3) under key (k0, k1)."""
+    for idx in range(PHILOX_ROUNDS):
+        if idx:
+            k0 = (k0 + PHILOX_W0) & MASK32
+            k1 = (k1 + PHILOX_W1) & MASK32
+        p0 = PHILOX_M0 * c0
+        p1 = PHILOX_M1 * c2
+        c0, c1, c2, c3 = (
+            (p1 >> 32) ^ c1 ^ k0,
+            p1 & MASK32,
+            (p0 >> 32) ^ c3 ^ k1,
+            p0 & MASK32,
+        )
+    return c0, c1, c2, c3
+
+
+def philox_array(c0, c1, c2, c3, k0, k1):
+    """Vectorized `philox` over broadcastable integer arrays."""
+    import numpy as np
+
+    c0, c1, c2, c3, k0, k1 = (
+        np.array(
+            np.broadcast_to(word, np.broadcast(c0, c1, c2, c3, k0, k1).shape)
+        ).astype(np.uint64)
+        for word in (c0, c1, c2, c3, k0, k1)
+    )
+    mask = np.uint64(MASK32)
+    shift = np.uint64(32)
+    for idx in range(PHILOX_ROUNDS):
+        if idx:
+            k0 = (k0 + np.uint64(PHILOX_W0)) & mask
+            k1 = (k1 + np.uint64(PHILOX_W1)) & mask
+        p0 = np.uint64(PHILOX_M0) * c0
+        p1 = np.uint64(PHILOX_M1) * c2
+        c0, c1, c2, c3 = (
+            (p1 >> shift) ^ c1 ^ k0,
+            p1 & mask,
+            (p0 >> shift) ^ c3 ^ k1,
+            p0 & mask,
+        )
+    return c0, c1, c2, c3
+
+
+def _to_uniform(a, b):
+    # 53 random bits, as random.random() builds them
+    return ((a >> 5) * 67108864.0 + (b >> 6)) * (1.0 / 9007199254740992.0)
+
+
+def derive_key(seed, *path):
+    """64-bit Philox key, as two 32-bit words, from any seed and a path."""
+    digest = hashlib.sha256(repr((seed,) + path).encode()).digest()
+    return int.from_bytes(digest[:4], "little"), int.from_bytes(digest[4:8], "little")
+
+
+class CounterStreams:
+    """Random draws addressed by (seed, day, place, transition).
+
+    Each draw reads uniforms from its own stream, the Philox block cipher
+    applied to the counter (day, place, transition, index) under a key
+    derived from the seed. Draws therefore depend only on their address,
+    never on how many draws came before, so places can be updated in any
+    order or split across any number of workers with bit-identical results.
+    Binomials are drawn with the same algorithms as `sampling.binomial`.
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.key = derive_key(seed)
+
+    def uniform_stream(self, day, place, transition):
+        """Zero-argument callable returning the stream's uniforms in order."""
+        return _KeyedStream(self.key, day, place, transition)
+
+    def place_binomial(self, day, place):
+        """binomial(n, p, transition) drawing from one place's streams."""
+
+        def draw(n, p, transition):
+            return binomial(n, p, self.uniform_stream(day, place, transition))
+
+        return draw
+
+    def uniforms(self, day, place, transition, index, key=None):
+        """Vectorized uniforms for broadcastable arrays of addresses."""
+        k0, k1 = self.key if key is None else key
+        a, b, _, _ = philox_array(day, place, transition, index, k0, k1)
+        return _to_uniform(a, b)
+
+    def binomials(self, n, p, day, place, transition, key=None):
+        """Vectorized binomial draws, one per element of broadcast `n`.
+
+        `day`, `place`, `transition` and `key` (a pair of word arrays,
+        default this stream's key) broadcast against `n`. Small means are
+        drawn by vectorized inversion and large ones by vectorized BTPE,
+        each element reading its own stream as `sampling.binomial` would.
+        """
+        import numpy as np
+
+        k0, k1 = self.key if key is None else key
+        address = (n, p, day, place, transition, k0, k1)
+        shape = np.broadcast(*address).shape
+        n, p, day, place, transition, k0, k1 = (
+            np.broadcast_to(values, shape).ravel() for values in address
+        )
+        n = n.astype(np.int64)
+        p = p.astype(np.float64)
+        out = np.where(p >= 1, n, 0)
+
+        # certain results consume no uniforms
+        live = np.flatnonzero((n > 0) & (p > 0) & (p < 1))
+        if live.size == 0:
+            return out.reshape(shape)
+        flip = p[live] > 0.5
+        q = np.where(flip, 1.0 - p[live], p[live])
+        small = n[live] * q <= INVERSION_CUTOFF
+
+        rows = live[small]
+        draws = self._inversion(
+            n[rows],
+            q[small],
+            (day[rows], place[rows], transition[rows], k0[rows], k1[rows]),
+        )
+        out[rows] = np.where(flip[small], n[rows] - draws, draws)
+
+        rows = live[~small]
+        if rows.size:
+            draws = self._btpe(
+                n[rows],
+                q[~small],
+                (day[rows], place[rows], transition[rows], k0[rows], k1[rows]),
+            )
+            out[rows] = np.where(flip[~small], n[rows] - draws, draws)
+        return out.reshape(shape)
+
+    def _inversion(self, n, p, address):
+        # vectorized sampling._inversion, restarts draw the stream's next uniform
+        import numpy as np
+
+        day, place, transition, k0, k1 = address
+        q = 1.0 - p
+        qn = np.exp(n * np.log(q))
+        np_ = n * p
+        bound = np.minimum(n, np_ + 10.0 * np.sqrt(np_ * q + 1)).astype(np.int64)
+
+        x = np.zeros(n.shape, dtype=np.int64)
+        u = self.uniforms(day, place, transition, 0, key=(k0, k1))
+
+        # the search runs on copies of the pending elements; finished ones
+        # are carried along, ignored, until most are done and it compacts
+        rows = np.flatnonzero(u > qn)
+        n, p, q, qn, bound, u = (values[rows] for values in (n, p, q, qn, bound, u))
+        px = qn.copy()
+        xs = np.zeros(rows.size, dtype=np.int64)
+        index = np.zeros(rows.size, dtype=np.int64)
+        live = np.ones(rows.size, dtype=bool)
+        while rows.size:
+            xs += 1
+            restart = np.flatnonzero(live & (xs > bound))
+            if restart.size:
+                xs[restart] = 0
+                px[restart] = qn[restart]
+                index[restart] += 1
+                rr = rows[restart]
+                u[restart] = self.uniforms(
+                    day[rr],
+                    place[rr],
+                    transition[rr],
+                    index[restart],
+                    key=(k0[rr], k1[rr]),
+                )
+            # restarted elements keep their fresh uniform; finished ones are
+            # stepped too but never read again
+            step = xs > 0
+            with np.errstate(all="ignore"):
+                u = np.where(step, u - px, u)
+                px = np.where(step, ((n - xs + 1) * p * px) / (xs * q), px)
+
+            done = live & (u <= px)
+            if done.any():
+                x[rows[done]] = xs[done]
+                live &= ~done
+                if np.count_nonzero(live) * 2 < rows.size:
+                    rows, n, p, q, qn, bound, u, px, xs, index = (
+                        values[live]
+                        for values in (rows, n, p, q, qn, bound, u, px, xs, index)
+                    )
+                    live = np.ones(rows.size, dtype=bool)
+        return x
+
+    def _btpe(self, n, p, address):
+        # vectorized sampling._btpe, p <= 0.5; each round draws the stream's
+        # next two uniforms for every element not yet accepted
+        import numpy as np
+
+        q = 1.0 - p
+        fm = n * p + p
+        m = np.floor(fm).astype(np.int64)
+        nrq = n * p * q
+        p1 = np.floor(2.195 * np.sqrt(nrq) - 4.6 * q) + 0.5
+        xm = m + 0.5
+        xl = xm - p1
+        xr = xm + p1
+        c = 0.134 + 20.5 / (15.3 + m)
+        a = (fm - xl) / (fm - xl * p)
+        laml = a * (1.0 + a / 2.0)
+        a = (xr - fm) / (xr * q)
+        lamr = a * (1.0 + a / 2.0)
+        p2 = p1 * (1.0 + 2.0 * c)
+        p3 = p2 + c / laml
+        p4 = p3 + c / lamr
+
+        out = np.zeros(n.shape, dtype=np.int64)
+        index = np.zeros(n.shape, dtype=np.int64)
+        pending = np.arange(n.size)
+        while pending.size:
+            day, place, transition, k0, k1 = (words[pending] for words in address)
+            u = self.uniforms(day, place, transition, index[pending], key=(k0, k1))
+            v = self.uniforms(day, place, transition, index[pending] + 1, key=(k0, k1))
+            index[pending] += 2
+            accepted = self._btpe_accept(
+                u * p4[pending],
+                v,
+                n[pending],
+                p[pending],
+                q[pending],
+                m[pending],
+                nrq[pending],
+                (p1, p2, p3, xm, xl, xr, c, laml, lamr),
+                pending,
+                out,
+            )
+            pending = pending[~accepted]
+        return out
+
+    @staticmethod
+    def _btpe_accept(u, v, n, p, q, m, nrq, setup, rows, out):
+        # one round of BTPE for each pending element, writes accepted draws
+        # to out[rows] and returns which were accepted
+        import numpy as np
+
+        p1, p2, p3, xm, xl, xr, c, laml, lamr = (value[rows] for value in setup)
+        accepted = np.zeros(u.size, dtype=bool)
+        y = np.zeros(u.size, dtype=np.int64)
+
+        # triangular region, accept immediately
+        triangle = u <= p1
+        y[triangle] = np.floor(xm - p1 * v + u)[triangle]
+        accepted[triangle] = True
+
+        # parallelogram region
+        candidate = np.zeros(u.size, dtype=bool)
+        idx = np.flatnonzero(~triangle & (u <= p2))
+        x = xl[idx] + (u[idx] - p1[idx]) / c[idx]
+        w = v[idx] * c[idx] + 1.0 - np.abs(m[idx] - x + 0.5) / p1[idx]
+        keep = w <= 1.0
+        v[idx] = w
+        y[idx] = np.floor(x)
+        candidate[idx[keep]] = True
+
+        # left exponential tail
+        idx = np.flatnonzero(~triangle & (u > p2) & (u <= p3) & (v > 0.0))
+        y[idx] = np.floor(xl[idx] + np.log(v[idx]) / laml[idx])
+        v[idx] = v[idx] * (u[idx] - p2[idx]) * laml[idx]
+        candidate[idx[y[idx] >= 0]] = True
+
+        # right exponential tail
+        idx = np.flatnonzero((u > p3) & (v > 0.0))
+        y[idx] = np.floor(xr[idx] - np.log(v[idx]) / lamr[idx])
+        v[idx] = v[idx] * (u[idx] - p3[idx]) * lamr[idx]
+        candidate[idx[y[idx] <= n[idx]]] = True
+
+        k = np.abs(y - m)
+        explicit = candidate & ((k <= 20) | (k >= nrq / 2.0 - 1))
+
+        # explicit evaluation of f(y) / f(m)
+        idx = np.flatnonzero(explicit)
+        s = p[idx] / q[idx]
+        a = s * (n[idx] + 1)
+        f = np.ones(idx.size)
+        low = np.minimum(m[idx], y[idx])
+        up = m[idx] < y[idx]
+        steps = k[idx]
+        for j in range(1, int(steps.max()) + 1 if idx.size else 1):
+            live = np.flatnonzero(steps >= j)
+            term = a[live] / (low[live] + j) - s[live]
+            f[live] = np.where(up[live], f[live] * term, f[live] / term)
+        accepted[idx[v[idx] <= f]] = True
+
+        # squeeze using upper and lower bounds on log(f(y))
+        idx = np.flatnonzero(candidate & ~explicit)
+        k, ki, yi, mi, ni = k[idx], nrq[idx], y[idx], m[idx], n[idx]
+        rho = (k / ki) * ((k * (k / 3.0 + 0.625) + 0.16666666666666666) / ki + 0.5)
+        t = -k * k / (2 * ki)
+        x1 = yi + 1
+        f1 = mi + 1
+        z = ni + 1 - mi
+        w = ni - yi + 1
+        # the bound is only read where alpha falls between the two squeezes
+        with np.errstate(divide="ignore", invalid="ignore"):
+            alpha = np.log(v[idx])
+            bound = (
+                xm[idx] * np.log(f1 / x1)
+                + (ni - mi + 0.5) * np.log(z / w)
+                + (yi - mi) * np.log(w * p[idx] / (x1 * q[idx]))
+                + _stirling_corrections(f1)
+                + _stirling_corrections(z)
+                + _stirling_corrections(x1)
+                + _stirling_corrections(w)
+            )
+        accepted[idx[(alpha < t - rho) | ((alpha <= t + rho) & (alpha <= bound))]] = (
+            True
+        )
+
+        out[rows[accepted]] = y[accepted]
+        return accepted
+
+
+def _stirling_corrections(x):
+    # vectorized sampling._stirling_correction
+    x2 = x * x
+    return (
+        (13680.0 - (462.0 - (132.0 - (99.0 - 140.0 / x2) / x2) / x2) / x2)
+        / x
+        / 166320.0
+    )
+
+
+class _KeyedStream:
+    """Scalar uniform stream for one address under an explicit key."""
+
+    def __init__(self, key, day, place, transition):
+        self.key = key
+        self.address = (day, place, transition)
+        self.index = 0
+
+    def __call__(self):
+        a, b, _, _ = philox(*self.address, self.index, *self.key)
+        self.index += 1
+        return _to_uniform(a, b)
+
+
+if __name__ == "__main__":
+    # known-answer tests from Random123
+    for counter, key, expected in [
+        ((0, 0, 0, 0), (0, 0), (0x6627E8D5, 0xE169C58D, 0xBC57AC4C, 0x9B00DBD8)),
+        (
+            (MASK32,) * 4,
+            (MASK32,) * 2,
+            (0x408F276D, 0x41C83B0E, 0xA20BC7C6, 0x6D5451FD),
+        ),
+        (
+            (0x243F6A88, 0x85A308D3, 0x13198A2E, 0x03707344),
+            (0xA4093822, 0x299F31D0),
+            (0xD16CFE09, 0x94FDCCEB, 0x5001E420, 0x24126EA1),
+        ),
+    ]:
+        assert philox(*counter, *key) == expected, counter
+        assert tuple(int(w) for w in philox_array(*counter, *key)) == expected
+    print("philox ok")
+
+    streams = CounterStreams(0)
+    draws = 20000
+    for n, p in [(5, 0.3), (50, 0.1), (100, 0.5), (400, 0.2), (1000, 0.95)]:
+        xs = streams.binomials(n, p, 1, range(draws), NEW_EXPOSED)
+        mean = xs.mean()
+        z = (mean - n * p) / math.sqrt(n * p * (1 - p) / draws)
+        print(
+            f"n={n} p={p}: mean={mean:.3f} (z={z:+.2f}) var={xs.var(ddof=1):.3f}"
+            + f" expected={n * p * (1 - p):.3f}"
+        )
@@ -0,0 +1,164 @@
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, replace
+from params import Params
+from sim import Pandemic
+
+
+def grid(base=None, **axes):
+    """Return one `Params` per combination of the given field values.
+
+    grid(travel_rate=[0.01, 0.02], contacts=[5, 10]) gives four parameter
+    sets, with every other field taken from `base` (default: consts).
+    """
+    base = base if base is not None else Params.from_consts()
+    names = list(axes)
+    return [
+        replace(base, **dict(zip(names, values)))
+        for values in itertools.product(*(axes[name] for name in names))
+    ]
+
+
+def summarize(params, seed, days, engine):
+    """Play one game without any control measures and summarize it."""
+    pandemic = Pandemic(engine=engine, seed=seed, params=params)
+    peak_infected = 0
+    days_to_win = None
+    lost = False
+    while pandemic.day < days:
+        pandemic.update()
+        totals = pandemic.get_totals()
+        peak_infected = max(peak_infected, totals.infected + totals.detected)
+
+        if pandemic.days_since_last_infection >= params.win_threshold:
+            days_to_win = pandemic.day
+            break
+        if pandemic.pct_dead >= params.lose_threshold:
+            lost = True
+            break
+
+    return {
+        "days": pandemic.day,
+        "days_to_win": days_to_win,
+        "lost": lost,
+        "peak_infected": peak_infected,
+        "pct_dead": pandemic.pct_dead,
+    }
+
+
+def _run_chunk(tasks, days, engine):
+    return [
+        {"index": index, "seed": seed, **summarize(params, seed, days, engine)}
+        for index, params, seed in tasks
+    ]
+
+
+def sweep(
+    param_sets,
+    runs=1,
+    days=1000,
+    seed=0,
+    engine="numpy",
+    workers=None,
+    chunksize=16,
+    results_path=None,
+    max_restarts=3,
+):
+    """Run every parameter set `runs` times across a process pool.
+
+    Returns one summary dict per run, ordered by run index. When
+    `results_path` is given, summaries are appended to it as JSON lines as
+    each chunk finishes, and runs already recorded there with the same
+    parameters, seed, `days` and `engine` are skipped, so an interrupted
+    sweep resumes where it stopped; runs recorded for a different sweep
+    are run again. If a worker process dies the pool is rebuilt and the
+    unfinished chunks resubmitted, up to `max_restarts` times.
+    """
+    param_sets = list(param_sets)
+    tasks = [
+        (set_idx * runs + run, params, f"{seed}-{set_idx}-{run}")
+        for set_idx, params in enumerate(param_sets)
+        for run in range(runs)
+    ]
+
+    results = _load(results_path) if results_path else {}
+
+    pending = [task for task in tasks if not _is_recorded(results, task, days, engine)]
+    chunks = [pending[i : i + chunksize] for i in range(0, len(pending), chunksize)]
+
+    restarts = 0
+    while chunks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_run_chunk, chunk, days, engine): chunk
+                for chunk in chunks
+            }
+            try:
+                for future in as_completed(futures):
+                    chunk_results = future.result()
+                    chunks.remove(futures[future])
+                    _record(
+                        results,
+                        chunk_results,
+                        param_sets,
+                        runs,
+                        days,
+                        engine,
+                        results_path,
+                    )
+            except BrokenProcessPool:
+                restarts += 1
+                if restarts > max_restarts:
+                    raise
+
+    return [results[index] for index, _, _ in tasks]
+
+
+def _is_recorded(results, task, days, engine):
+    index, params, seed = task
+    result = results.get(index)
+    return (
+        result is not None
+        and result.get("seed") == seed
+        and result.get("params") == asdict(params)
+        and result.get("max_days") == days
+        and result.get("engine") == engine
+    )
+
+
+def _load(results_path):
+    results = {}
+    if not os.path.exists(results_path):
+        return results
+
+    with open(results_path, "r") as file:
+        for line in file:
+            # a crash can leave a partly written last line
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[result["index"]] = result
+
+    # rewrite without the partial line so new results start on a fresh line
+    with open(results_path, "w") as file:
+        for result in results.values():
+            file.write(json.dumps(result) + "\n")
+    return results
+
+
+def _record(results, chunk_results, param_sets, runs, days, engine, results_path):
+    for result in chunk_results:
+        # "days" is the number played, "max_days" the sweep's limit
+        result["params"] = asdict(param_sets[result["index"] // runs])
+        result["max_days"] = days
+        result["engine"] = engine
+        results[result["index"]] = result
+
+    if results_path:
+        with open(results_path, "a") as file:
+            for result in chunk_results:
+                file.write(json.dumps(result) + "\n")
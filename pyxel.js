@@ -48,7 +48,7 @@ async function launchPyxel(params) {
   _suppressPinchOperations();
   let canvas = await _createScreenElements();
   let pyodide = await _loadPyodideAndPyxel(canvas);
-  await pyodide.loadPackage("networkx");
+  await pyodide.loadPackage("numpy");
   _hookFileOperations(pyodide, params.root || ".");
   await _waitForInput();
   await _executePyxelCommand(pyodide, params);